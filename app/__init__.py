@@ -1,2 +1 @@
 from . import models
-from . import handlers
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# Marks a cache miss, so that None can be cached as a real value
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        item = self._data.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+        # Least recently used keys are evicted first
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._data)
+
+
+class AsyncQueryCache:
+    # Caches awaited query results (not coroutines); concurrent misses for one key share a single load
+    def __init__(self, maxsize: int = 5_000, ttl: float = 300):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._pending = {}
+
+    async def get_or_load(self, key, loader):
+        value = self._cache.get(key)
+        if value is not MISSING:
+            return value
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._pending[key] = task
+        # shield: one cancelled caller must not cancel the load the others wait on
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+        finally:
+            # An invalidation during the load replaces or drops our pending entry
+            current = self._pending.get(key) is task
+            if current:
+                del self._pending[key]
+        if current:
+            self._cache.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        self._cache.invalidate(key)
+        self._pending.pop(key, None)
+
+    def clear(self):
+        self._cache.clear()
+        self._pending.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
@@ -0,0 +1,99 @@
+import re
+from datetime import date, datetime
+from itertools import cycle
+
+from tortoise import Tortoise
+from tortoise.exceptions import ConfigurationError
+
+from config import READ_CONNECTIONS
+
+# Raw SQL helpers for the hot paths the ORM can't express in a single query.
+# Queries are written with "?" placeholders and translated per dialect.
+
+_PLACEHOLDER = re.compile(r"\?")
+
+
+_readers = cycle(READ_CONNECTIONS or ["default"])
+
+
+def get_connection(name: str = "default"):
+    return Tortoise.get_connection(name)
+
+
+def get_reader():
+    # Next reader connection in turn; "default" when Tortoise runs without readers
+    try:
+        return get_connection(next(_readers))
+    except ConfigurationError:
+        return get_connection()
+
+
+class ReadWriteRouter:
+    # Tortoise router from config.py: ORM reads go to the readers, every write to the
+    # single "default" writer. Queries given using_db (transactions) are not routed.
+    def db_for_read(self, model):
+        return next(_readers)
+
+    def db_for_write(self, model):
+        return "default"
+
+
+def prepare(connection, sql: str, values) -> tuple:
+    values = list(values)
+    if connection.capabilities.dialect == "postgres":
+        counter = iter(range(1, len(values) + 1))
+        sql = _PLACEHOLDER.sub(lambda _: f"${next(counter)}", sql)
+    elif connection.capabilities.dialect == "sqlite":
+        values = [_to_sqlite(value) for value in values]
+    return sql, values
+
+
+def _to_sqlite(value):
+    # Same text format Tortoise uses for DATE/TIMESTAMP columns on SQLite
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def to_date(value) -> date:
+    # SQLite hands DATE columns back as ISO strings from raw queries
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def to_datetime(value) -> datetime:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+async def fetch_all(sql: str, *values, connection=None) -> list:
+    connection = connection or get_reader()
+    sql, values = prepare(connection, sql, values)
+    return await connection.execute_query_dict(sql, values)
+
+
+async def execute(sql: str, *values, connection=None) -> int:
+    connection = connection or get_connection()
+    sql, values = prepare(connection, sql, values)
+    rowcount, _ = await connection.execute_query(sql, values)
+    return rowcount
+
+
+async def stream(sql: str, *values, batch: int = 500, connection=None):
+    # Yields rows one by one from a server-side cursor, the result is never loaded whole.
+    # The connection stays busy until the generator is exhausted or closed.
+    connection = connection or get_reader()
+    sql, values = prepare(connection, sql, values)
+    async with connection.acquire_connection() as raw:
+        if connection.capabilities.dialect == "postgres":
+            # asyncpg cursors only live inside a transaction
+            async with raw.transaction():
+                async for record in raw.cursor(sql, *values, prefetch=batch):
+                    yield dict(record)
+            return
+
+        async with raw.execute(sql, values) as cursor:
+            names = [column[0] for column in cursor.description]
+            while rows := await cursor.fetchmany(batch):
+                for row in rows:
+                    yield dict(zip(names, row))
@@ -0,0 +1,157 @@
+import csv
+import os
+import tempfile
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+
+from app.db import fetch_all, stream, to_date
+
+# Days of the range on which the class has any mark, these become the columns
+EXPORT_DAYS_SQL = """
+SELECT DISTINCT day FROM attendances
+WHERE class_id_id = ? AND day >= ? AND day <= ?
+ORDER BY day
+"""
+
+# Marks of every enrolled student, ordered so one student's row arrives in one piece
+EXPORT_MARKS_SQL = """
+SELECT u.id AS student_id, u.full_name, a.day, a.is_present
+FROM classes_users cu
+JOIN users u ON u.id = cu.user_id
+LEFT JOIN attendances a
+    ON a.user_id = cu.user_id
+    AND a.class_id_id = cu.classes_id
+    AND a.day >= ? AND a.day <= ?
+WHERE cu.classes_id = ?
+ORDER BY u.full_name, u.id, a.day
+"""
+
+PRESENT = "+"
+ABSENT = "-"
+
+
+async def attendance_matrix(class_id: int, start: date, end: date):
+    # Yields the header, then one row per student: name, a mark per day, totals
+    days = [to_date(row["day"]) for row in await fetch_all(EXPORT_DAYS_SQL, class_id, start, end)]
+    columns = {day: index for index, day in enumerate(days)}
+    yield ["O'quvchi", *(day.strftime("%d.%m.%Y") for day in days), "Keldi", "Kelmadi", "Foiz"]
+
+    student_id = None
+    name = None
+    marks = None
+    async for row in stream(EXPORT_MARKS_SQL, start, end, class_id):
+        if row["student_id"] != student_id:
+            if student_id is not None:
+                yield _student_row(name, marks)
+            student_id, name, marks = row["student_id"], row["full_name"], [""] * len(days)
+        # A day first marked after the header was read has no column, it goes to the next export
+        column = columns.get(to_date(row["day"])) if row["day"] is not None else None
+        if column is not None:
+            marks[column] = PRESENT if row["is_present"] else ABSENT
+    if student_id is not None:
+        yield _student_row(name, marks)
+
+
+def _student_row(name: str, marks: list) -> list:
+    present = marks.count(PRESENT)
+    absent = marks.count(ABSENT)
+    percent = round(present / (present + absent) * 100, 1) if present + absent else ""
+    return [name, *marks, present, absent, percent]
+
+
+async def write_csv(rows, path: str):
+    with open(path, "w", newline="", encoding="utf-8-sig") as file:
+        writer = csv.writer(file)
+        async for row in rows:
+            writer.writerow(row)
+
+
+def _column_name(index: int) -> str:
+    name = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def _xlsx_row(number: int, row: list) -> str:
+    cells = []
+    for index, value in enumerate(row):
+        ref = f"{_column_name(index)}{number}"
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+        elif value != "":
+            cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Davomat" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+async def write_xlsx(rows, path: str):
+    # Minimal single-sheet workbook; the sheet XML is streamed into the zip row by row
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        with workbook.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            number = 0
+            async for row in rows:
+                number += 1
+                sheet.write(_xlsx_row(number, row).encode())
+            sheet.write(b"</sheetData></worksheet>")
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx}
+
+
+async def export_attendance(class_id: int, start: date, end: date, file_format: str = "xlsx") -> str:
+    # Returns the path of a temporary file, the caller deletes it after sending
+    handle, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(handle)
+    try:
+        await WRITERS[file_format](attendance_matrix(class_id, start, end), path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
@@ -1,3 +1 @@
-from . import user, lesson
-
 __all__ = ['user', 'lesson']
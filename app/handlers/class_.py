@@ -3,6 +3,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from app.models import User, Class
+from app.queries import enroll_student
 
 router = Router()
 
@@ -11,9 +12,7 @@ class ClassState(StatesGroup):
     select_class = State()
 
 @router.message(F.text == "🏫 Sinf qo'shish")
-async def add_class(message: types.Message, state: FSMContext):
-    user = await User.get_or_none(user_id=message.from_user.id)
-    
+async def add_class(message: types.Message, state: FSMContext, user: User):
     if not user or not user.is_teacher:
         await message.answer("⚠️ Faqat o'qituvchilar sinf qo'sha oladi!")
         return
@@ -22,9 +21,7 @@ async def add_class(message: types.Message, state: FSMContext):
     await state.set_state(ClassState.name)
 
 @router.message(ClassState.name)
-async def process_class_name(message: types.Message, state: FSMContext):
-    user = await User.get_or_none(user_id=message.from_user.id)
-    
+async def process_class_name(message: types.Message, state: FSMContext, user: User):
     # Sinf nomini tekshirish
     if len(message.text) < 2:
         await message.answer("⚠️ Sinf nomi juda qisqa!")
@@ -43,15 +40,13 @@ async def process_class_name(message: types.Message, state: FSMContext):
     await state.clear()
 
 @router.message(F.text == "🎓 Sinfga a'zo bo'lish")
-async def select_class_for_student(message: types.Message, state: FSMContext):
-    user = await User.get_or_none(user_id=message.from_user.id)
-    
+async def select_class_for_student(message: types.Message, state: FSMContext, user: User):
     if not user or not user.is_student:
         await message.answer("⚠️ Faqat o'quvchilar sinfga a'zo bo'lishi mumkin!")
         return
     
     # Mavjud sinflarni olish
-    classes = await Class.all().prefetch_related('teacher')
+    classes = await Class.all().select_related('teacher')
     
     if not classes:
         await message.answer("🚫 Hozircha sinflar mavjud emas!")
@@ -60,50 +55,33 @@ async def select_class_for_student(message: types.Message, state: FSMContext):
     # Keyboard yaratish
     keyboard = []
     for class_obj in classes:
-        # Explicitly fetch the teacher
-        teacher = await User.get_or_none(id=class_obj.teacher_id)
-        
-        if teacher:
-            keyboard.append([types.InlineKeyboardButton(
-                text=f"🏫 {class_obj.name} (O'qituvchi: {teacher.full_name})",
-                callback_data=f"join_class_{class_obj.id}"
-            )])
-    
-    if not keyboard:
-        await message.answer("🚫 Hozircha sinflar mavjud emas!")
-        return
+        keyboard.append([types.InlineKeyboardButton(
+            text=f"🏫 {class_obj.name} (O'qituvchi: {class_obj.teacher.full_name})",
+            callback_data=f"join_class_{class_obj.id}"
+        )])
     
     markup = types.InlineKeyboardMarkup(inline_keyboard=keyboard)
     await state.set_state(ClassState.select_class)
     await message.answer("🏫 Qaysi sinfga a'zo bo'lmoqchisiz?", reply_markup=markup)
 
 @router.callback_query(F.data.startswith("join_class_"))
-async def process_class_selection(callback: types.CallbackQuery, state: FSMContext):
+async def process_class_selection(callback: types.CallbackQuery, state: FSMContext, user: User):
     class_id = int(callback.data.split('_')[2])
-    user = await User.get_or_none(user_id=callback.from_user.id)
-    
     if not user or not user.is_student:
         await callback.message.answer("⚠️ Faqat o'quvchilar sinfga a'zo bo'lishi mumkin!")
         return
     
     try:
-        class_obj = await Class.get(id=class_id)
-        
-        # Explicitly fetch the teacher
-        teacher = await User.get_or_none(id=class_obj.teacher_id)
-        
-        if not teacher:
-            await callback.message.answer("❌ Sinf uchun o'qituvchi topilmadi!")
-            return
+        class_obj = await Class.get(id=class_id).select_related("teacher")
+        teacher = class_obj.teacher
         
         # Tekshirish: foydalanuvchi allaqachon shu sinfga a'zo bo'lganmi
-        existing_classes = await user.enrolled_classes.all()
-        if class_obj in existing_classes:
+        if await user.enrolled_classes.filter(id=class_id).exists():
             await callback.message.answer(f"❗ Siz allaqachon '{class_obj.name}' sinfiga a'zo bo'lgansiz!")
             return
         
         # Sinfga a'zo bo'lish
-        await class_obj.students.add(user)
+        await enroll_student(class_obj, user)
         
         await state.clear()
         await callback.message.answer(
@@ -117,15 +95,14 @@ async def process_class_selection(callback: types.CallbackQuery, state: FSMConte
     await callback.answer()
 
 @router.message(F.text == "📋 Mening sinflarim")
-async def list_student_classes(message: types.Message):
-    user = await User.get_or_none(user_id=message.from_user.id)
-    
+async def list_student_classes(message: types.Message, user: User):
     if not user:
         await message.answer("⚠️ Foydalanuvchi topilmadi!")
         return
     
     if user.is_student:
-        classes = await user.enrolled_classes.all()
+        # Teachers are joined in rather than fetched one per class
+        classes = await user.enrolled_classes.all().select_related("teacher")
         
         if not classes:
             await message.answer("🚫 Siz hech qanday sinfga a'zo emassiz!")
@@ -133,11 +110,7 @@ async def list_student_classes(message: types.Message):
         
         text = "🏫 Sizning sinflaringiz:\n\n"
         for class_obj in classes:
-            # Explicitly fetch the teacher
-            teacher = await User.get_or_none(id=class_obj.teacher_id)
-            
-            if teacher:
-                text += f"• {class_obj.name} (O'qituvchi: {teacher.full_name})\n"
+            text += f"• {class_obj.name} (O'qituvchi: {class_obj.teacher.full_name})\n"
         
         await message.answer(text)
     else:
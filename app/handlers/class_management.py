@@ -1,8 +1,11 @@
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from tortoise.expressions import Subquery
+from tortoise.functions import Count
 
 from app.models import User, Class
+from app.queries import enroll_student
 from app.keyboards import get_class_list_keyboard
 
 router = Router()
@@ -44,21 +47,23 @@ async def list_classes(message: types.Message):
         await message.answer("Siz ro'yxatdan o'tmagansiz!")
         return
 
+    # Student counts come with the classes, not one COUNT per class
     if user.is_teacher:
-        classes = await Class.filter(teacher=user)
+        classes = await Class.filter(teacher=user).annotate(student_count=Count("students"))
         if not classes:
             await message.answer("Siz hali sinf qo'shmagansiz!")
             return
     else:
-        classes = await user.enrolled_classes.all()
+        # Filtering on the same join would count only this student
+        enrolled = Subquery(user.enrolled_classes.all().values("id"))
+        classes = await Class.filter(id__in=enrolled).annotate(student_count=Count("students"))
         if not classes:
             await message.answer("Siz hali birorta sinfga a'zo emassiz!")
             return
 
     text = "Sinflar ro'yxati:\n\n"
     for class_obj in classes:
-        student_count = await class_obj.students.all().count()
-        text += f"📚 {class_obj.name} - {student_count} ta o'quvchi\n"
+        text += f"📚 {class_obj.name} - {class_obj.student_count} ta o'quvchi\n"
 
     await message.answer(text)
 
@@ -91,7 +96,7 @@ async def process_class_selection(callback: types.CallbackQuery, state: FSMConte
         return
 
     if user.is_student:
-        await class_obj.students.add(user)
+        await enroll_student(class_obj, user)
         await state.clear()
         await callback.message.answer(f"Siz '{class_obj.name}' sinfiga muvaffaqiyatli a'zo bo'ldingiz!")
     else:
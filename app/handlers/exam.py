@@ -4,6 +4,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from app.models import User, Exam, Grade, Subject, Lesson
 from app.handlers.user import get_teacher_keyboard, get_student_keyboard
+from app.pagination import Picker
+from app.queries import get_teacher_subjects
+from app.reports import exam_results_report
+from app.stats import add_grade
+from app.outbox import outbox
 from datetime import datetime
 import logging
 
@@ -15,6 +20,18 @@ class ExamStates(StatesGroup):
     waiting_for_student = State()
     waiting_for_grade = State()
 
+exam_subject_picker = Picker(
+    "examsub",
+    get_teacher_subjects,
+    lambda subject, teacher_id: (subject.title, f"select_subject:{subject.id}"),
+    cached=True
+)
+exam_student_picker = Picker(
+    "examstu",
+    lambda exam_id: User.filter(is_student=True),
+    lambda student, exam_id: (student.full_name, f"grade_student:{student.id}:{exam_id}")
+)
+
 def get_teacher_exam_keyboard():
     markup = types.ReplyKeyboardMarkup(
         keyboard=[
@@ -45,8 +62,7 @@ def get_student_exam_keyboard():
     return markup
 
 @router.message(F.text == "🔙 Orqaga")
-async def back_to_main_menu(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
+async def back_to_main_menu(message: types.Message, user: User):
     if user.is_teacher:
         markup = get_teacher_keyboard()
     else:
@@ -54,9 +70,7 @@ async def back_to_main_menu(message: types.Message):
     await message.answer("🏠 Asosiy menyu:", reply_markup=markup)
 
 @router.message(F.text == "📚 Imtihonlar")
-async def show_exam_menu(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
-    
+async def show_exam_menu(message: types.Message, user: User):
     if user.is_teacher:
         markup = get_teacher_exam_keyboard()
         await message.answer("📚 Imtihon menyusi:", reply_markup=markup)
@@ -65,15 +79,14 @@ async def show_exam_menu(message: types.Message):
         await message.answer("📚 Imtihon menyusi:", reply_markup=markup)
 
 @router.message(F.text == "📝 Yangi imtihon yaratish")
-async def create_exam(message: types.Message, state: FSMContext):
-    user = await User.get(user_id=message.from_user.id)
+async def create_exam(message: types.Message, state: FSMContext, user: User):
     if not user.is_teacher:
         await message.answer("❌ Bu funksiya faqat o'qituvchilar uchun!")
         return
     
     # Get teacher's subjects
-    subjects = await Subject.filter(teacher=user)
-    if not subjects:
+    markup = await exam_subject_picker.markup(user.id)
+    if not markup:
         await message.answer(
             "❌ Siz hali birorta fan yaratmagansiz!\n"
             "Iltimos, avval fan yarating.",
@@ -81,18 +94,6 @@ async def create_exam(message: types.Message, state: FSMContext):
         )
         return
     
-    # Create inline keyboard with subjects
-    buttons = []
-    for subject in subjects:
-        buttons.append([
-            types.InlineKeyboardButton(
-                text=subject.title,
-                callback_data=f"select_subject:{subject.id}"
-            )
-        ])
-    
-    markup = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-    
     await message.answer(
         "📚 Imtihon uchun fanni tanlang:",
         reply_markup=markup
@@ -112,8 +113,7 @@ async def process_subject_selection(callback: types.CallbackQuery, state: FSMCon
     await callback.answer()
 
 @router.message(ExamStates.waiting_for_title)
-async def process_exam_title(message: types.Message, state: FSMContext):
-    user = await User.get(user_id=message.from_user.id)
+async def process_exam_title(message: types.Message, state: FSMContext, user: User):
     data = await state.get_data()
     subject = await Subject.get(id=data['subject_id'])
     
@@ -124,9 +124,9 @@ async def process_exam_title(message: types.Message, state: FSMContext):
     )
     await state.update_data(exam_id=exam.id)
     
-    # Get all students
-    students = await User.filter(is_student=True)
-    if not students:
+    # Students are listed one page at a time
+    markup = await exam_student_picker.markup(exam.id)
+    if not markup:
         await message.answer(
             "❌ Hozircha o'quvchilar yo'q!",
             reply_markup=get_teacher_exam_keyboard()
@@ -134,18 +134,6 @@ async def process_exam_title(message: types.Message, state: FSMContext):
         await state.clear()
         return
     
-    # Create inline keyboard with students
-    buttons = []
-    for student in students:
-        buttons.append([
-            types.InlineKeyboardButton(
-                text=student.full_name,
-                callback_data=f"grade_student:{student.user_id}:{exam.id}"
-            )
-        ])
-    
-    markup = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-    
     await message.answer(
         "👨‍🎓 O'quvchini tanlang:",
         reply_markup=markup
@@ -174,61 +162,32 @@ async def process_grade(message: types.Message, state: FSMContext):
         return
     
     data = await state.get_data()
-    exam = await Exam.get(id=data['exam_id'])
-    student = await User.get(user_id=data['student_id'])
+    exam = await Exam.get(id=data['exam_id']).select_related('subject')
+    student = await User.get(id=data['student_id'])
 
     # Save grade
-    await Grade.create(
-        student=student,
-        exam=exam,
-        score=score
-    )
+    await add_grade(student, exam.subject, score, exam=exam)
     
     await message.answer(f"✅ {student.full_name} uchun {score} baho qo'yildi!")
     await state.clear()
 
-@router.message(F.text == "📊 Imtihon natijalari")
-async def show_exam_results(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
+@router.message(F.text == "📊 Imtihon natijalari", flags={"rate_limit": "report", "query_budget": 1})
+async def show_exam_results(message: types.Message, user: User):
     if not user.is_teacher:
         await message.answer("❌ Bu funksiya faqat o'qituvchilar uchun!")
         return
     
-    subjects = await Subject.filter(teacher=user).prefetch_related('exams')
-    if not subjects:
-        await message.answer("❌ Siz hali birorta fan yaratmagansiz!")
+    # Barcha fanlar va imtihonlar bitta so'rovda, natija sahifalab ko'rsatiladi
+    text, markup = await exam_results_report.open(user.id)
+    if text is None:
+        await message.answer("❌ Sizda hali imtihonlar yo'q!")
         return
     
-    for subject in subjects:
-        exams = await Exam.filter(subject=subject).prefetch_related('grades', 'grades__student')
-        if not exams:
-            continue
-        
-        subject_text = f"📚 Fan: {subject.title}\n\n"
-        
-        for exam in exams:
-            grades = exam.grades
-            if not grades:
-                result_text = "❌ Hali baholar qo'yilmagan"
-            else:
-                result_text = "\n".join([
-                    f"👤 {grade.student.full_name}: {grade.score}"
-                    for grade in grades
-                ])
-            
-            subject_text += (
-                f"📝 Imtihon: {exam.title}\n"
-                f"📅 Sana: {exam.created_at.strftime('%d.%m.%Y')}\n"
-                f"{result_text}\n\n"
-            )
-        
-        await message.answer(subject_text)
+    await message.answer(text, reply_markup=markup)
 
-@router.message(F.text == "📊 Mening baholarim")
-async def show_student_grades(message: types.Message):
+@router.message(F.text == "📊 Mening baholarim", flags={"rate_limit": "report"})
+async def show_student_grades(message: types.Message, user: User):
     try:
-        user = await User.get(user_id=message.from_user.id)
-        
         if not user or not user.is_student:
             await message.answer("❌ Bu funksiya faqat o'quvchilar uchun!")
             return
@@ -250,13 +209,13 @@ async def show_student_grades(message: types.Message):
         if exam_grades:
             grades_message += "📝 Imtihon baholari:\n"
             for grade in exam_grades:
-                grades_message += f"• {grade.exam.title}: {grade.score}/100\n"
+                grades_message += f"• {grade.exam.title}: {grade.value}/100\n"
             grades_message += "\n"
             
         if lesson_grades:
             grades_message += "📚 Dars baholari:\n"
             for grade in lesson_grades:
-                grades_message += f"• {grade.lesson.title}: {grade.score}/5\n"
+                grades_message += f"• {grade.lesson.title}: {grade.value}/5\n"
         
         await message.answer(grades_message)
         
@@ -274,13 +233,7 @@ async def process_grade(callback: types.CallbackQuery, state: FSMContext):
         current_date = datetime.now()
         
         # Bahoni saqlash
-        await Grade.create(
-            student=student,
-            subject=subject,
-            value=int(grade),
-            month=current_date.month,
-            year=current_date.year
-        )
+        await add_grade(student, subject, int(grade))
         
         # Baho qo'yilgani haqida xabar
         await callback.answer(
@@ -289,17 +242,17 @@ async def process_grade(callback: types.CallbackQuery, state: FSMContext):
         )
         
         # O'quvchiga xabar yuborish
-        await callback.bot.send_message(
-            student.telegram_id,
+        outbox.send(
+            student.user_id,
             f"📝 Sizga {subject.title} fanidan {grade} baho qo'yildi"
         )
         
         # Baholar ro'yxatini yangilash
+        # grades has no month/year columns, the month is taken from created_at
         grades = await Grade.filter(
             student=student,
             subject=subject,
-            month=current_date.month,
-            year=current_date.year
+            created_at__gte=current_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         )
         
         text = f"{student.full_name}ning {subject.title} fani bo'yicha baholari:\n\n"
@@ -3,6 +3,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from app.models import User, Lesson, Grade, Class
+from app.stats import add_grade
 
 router = Router()
 
@@ -10,8 +11,7 @@ class GradeState(StatesGroup):
     score = State()
 
 @router.message(F.text == "📝 Baho Qo'yish")
-async def cmd_add_grade(message: types.Message, state: FSMContext):
-    user = await User.get_or_none(user_id=message.from_user.id)
+async def cmd_add_grade(message: types.Message, state: FSMContext, user: User):
     if not user or not user.is_teacher:
         await message.answer("⚠️ Faqat o'qituvchilar baho qo'ya oladi!")
         return
@@ -74,14 +74,10 @@ async def process_grade_input(message: types.Message, state: FSMContext):
         lesson_id = data.get('lesson_id')
         
         student = await User.get(id=student_id)
-        lesson = await Lesson.get(id=lesson_id)
+        lesson = await Lesson.get(id=lesson_id).select_related('subject')
         
         # Baho yaratish
-        grade = await Grade.create(
-            student=student,
-            lesson=lesson,
-            score=score
-        )
+        grade = await add_grade(student, lesson.subject, score, lesson=lesson)
         
         await message.answer(
             f"✅ {student.full_name} uchun {lesson.title} darsidan {score} baho qo'yildi!"
@@ -3,6 +3,7 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from app.models import User, Subject, Class
+from app.queries import get_teacher_classes
 
 router = Router()
 
@@ -17,8 +18,7 @@ class LessonCreation(StatesGroup):
     days = State()  # Darsning kunlarini belgilash uchun
 
 @router.message(F.text == "📚 Fan qo'shish")
-async def cmd_add_subject(message: types.Message, state: FSMContext):
-    user = await User.get_or_none(user_id=message.from_user.id)
+async def cmd_add_subject(message: types.Message, state: FSMContext, user: User):
     if not user or not user.is_teacher:
         await message.answer("⚠️ Bu funksiya faqat o'qituvchilar uchun!")
         return
@@ -27,9 +27,7 @@ async def cmd_add_subject(message: types.Message, state: FSMContext):
     await state.set_state(SubjectCreation.title)
 
 @router.message(SubjectCreation.title)
-async def process_subject_title(message: types.Message, state: FSMContext):
-    user = await User.get_or_none(user_id=message.from_user.id)
-    
+async def process_subject_title(message: types.Message, state: FSMContext, user: User):
     subject = await Subject.create(
         title=message.text,
         teacher=user
@@ -41,8 +39,7 @@ async def process_subject_title(message: types.Message, state: FSMContext):
     await state.clear()
 
 @router.message(F.text == "➕ Dars qo'shish")
-async def cmd_add_lesson(message: types.Message, state: FSMContext):
-    user = await User.get_or_none(user_id=message.from_user.id)
+async def cmd_add_lesson(message: types.Message, state: FSMContext, user: User):
     if not user or not user.is_teacher:
         await message.answer("⚠️ Bu funksiya faqat o'qituvchilar uchun!")
         return
@@ -65,13 +62,12 @@ async def cmd_add_lesson(message: types.Message, state: FSMContext):
     await message.answer("📚 Qaysi fan uchun dars qo'shmoqchisiz?", reply_markup=markup)
 
 @router.callback_query(lambda c: c.data.startswith("subject:"))
-async def process_subject_selection(callback: types.CallbackQuery, state: FSMContext):
+async def process_subject_selection(callback: types.CallbackQuery, state: FSMContext, user: User):
     subject_id = int(callback.data.split(":")[1])
     subject = await Subject.get(id=subject_id)
     
     # O'qituvchining sinflari
-    user = await User.get(user_id=callback.from_user.id)
-    classes = await Class.filter(teacher=user)
+    classes = await get_teacher_classes(user.id)
     
     if not classes:
         await callback.message.answer("⚠️ Avval sinf yarating!")
@@ -127,7 +123,7 @@ async def process_lesson_description(message: types.Message, state: FSMContext):
     await state.set_state(LessonCreation.days)
 
 @router.callback_query(lambda c: c.data.startswith("day:"))
-async def process_lesson_days(callback: types.CallbackQuery, state: FSMContext):
+async def process_lesson_days(callback: types.CallbackQuery, state: FSMContext, user: User):
     day = callback.data.split(":")[1]
     
     # Oldingi ma'lumotlarni olish
@@ -138,8 +134,6 @@ async def process_lesson_days(callback: types.CallbackQuery, state: FSMContext):
     description = data.get('description')
     
     # O'qituvchini olish
-    user = await User.get(user_id=callback.from_user.id)
-    
     # Darsni yaratish
     lesson = await Lesson.create(
         title=title,
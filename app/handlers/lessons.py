@@ -4,6 +4,7 @@ from aiogram.dispatcher import FSMContext
 from app.states import LessonState
 from app.models.user import User
 from app.models.lesson import Lesson
+from app.reports import lessons_report, teacher_lessons_report
 
 async def add_lesson(message: types.Message):
     user = await User.filter(user_id=message.from_user.id).first()
@@ -41,23 +42,14 @@ async def list_lessons(message: types.Message):
         return
 
     if user.is_teacher:
-        lessons = await Lesson.filter(teacher=user)
-        if not lessons:
+        text, markup = await teacher_lessons_report.open(user.id)
+        if text is None:
             await message.answer("Siz hali dars qo'shmagansiz!")
             return
-        
-        text = "Sizning darslaringiz:\n\n"
-        for lesson in lessons:
-            text += f"📚 {lesson.title}\n📝 {lesson.description}\n\n"
     else:
-        lessons = await Lesson.all()
-        if not lessons:
+        text, markup = await lessons_report.open()
+        if text is None:
             await message.answer("Hozircha darslar mavjud emas!")
             return
-        
-        text = "Mavjud darslar:\n\n"
-        for lesson in lessons:
-            teacher = await lesson.teacher
-            text += f"📚 {lesson.title}\n👨‍🏫 O'qituvchi: {teacher.full_name}\n📝 {lesson.description}\n\n"
     
-    await message.answer(text)
+    await message.answer(text, reply_markup=markup)
@@ -0,0 +1,38 @@
+from aiogram import Router, F, types
+
+from app.models import User
+from app.pagination import parse_page
+from app.reports import NOT_ALLOWED, parse_report
+
+router = Router()
+
+
+@router.callback_query(F.data.startswith("page:"))
+async def process_page(callback: types.CallbackQuery):
+    picker, args, after, before = parse_page(callback.data)
+    if not picker:
+        await callback.answer("Bu ro'yxat eskirgan", show_alert=True)
+        return
+
+    markup = await picker.markup(*args, after=after, before=before)
+    if markup:
+        await callback.message.edit_reply_markup(reply_markup=markup)
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("report:"))
+async def process_report_page(callback: types.CallbackQuery, user: User):
+    # Pages come from the report cache, the report is loaded again only after it expires
+    report, args, number = parse_report(callback.data)
+    if report and not await report.allowed(user, *args):
+        await callback.answer(NOT_ALLOWED, show_alert=True)
+        return
+
+    text, markup = (None, None) if not report else await report.show(args, number)
+    if text is None:
+        await callback.answer("Bu hisobot eskirgan", show_alert=True)
+        return
+
+    if text != callback.message.text:
+        await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
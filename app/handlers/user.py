@@ -1,12 +1,28 @@
 from aiogram import Router, F, types
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from datetime import datetime
-from app.models import User, Class, Subject, Grade, Attendance
+from datetime import date, datetime
+from aiogram.types import FSInputFile
+from app.export import export_attendance
+from app.importer import READERS, claim_invite, import_roster, roster_rows
+from app.models import User, Class, Subject, Grade
 from app.keyboards import get_teacher_keyboard, get_student_keyboard, get_register_keyboard
+from app.middlewares import user_cache
+from app.outbox import outbox
+from app.pagination import Picker
+from app.queries import enroll_student, get_class_roster, get_class_subjects, get_teacher_classes
+from app.reports import (
+    NOT_ALLOWED, class_grades_report, class_results_report, paginate, student_attendance_report,
+    student_results_report
+)
+from app.roll_call import upsert_attendance
+from app.stats import add_grade
 import logging
 import os
+import tempfile
+import zipfile
+from xml.etree import ElementTree
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,13 +44,64 @@ class TeacherActions(StatesGroup):
     waiting_for_class_name = State()
     waiting_for_subject_name = State()
     waiting_for_grade = State()
+    waiting_for_roster = State()
 
 class StudentActions(StatesGroup):
     waiting_for_class_selection = State()
 
-@router.message(Command("start"))
-async def cmd_start(message: types.Message, state: FSMContext):
-    user = await User.filter(user_id=message.from_user.id).first()
+# Ro'yxat klaviaturalari sahifalab yuklanadi
+def teacher_class_picker(name, prefix):
+    return Picker(
+        name,
+        get_teacher_classes,
+        lambda class_obj, teacher_id: (class_obj.name, f"{prefix}{class_obj.id}"),
+        cached=True
+    )
+
+join_class_picker = Picker(
+    "join",
+    lambda: Class.all(),
+    lambda class_obj: (class_obj.name, f"join_class_{class_obj.id}")
+)
+results_class_picker = teacher_class_picker("results", "class_results_")
+attendance_class_picker = teacher_class_picker("attendance", "attendance_class:")
+grades_class_picker = teacher_class_picker("grades", "view_class_grades_")
+grade_class_picker = teacher_class_picker("gradecls", "grade_class_")
+import_class_picker = teacher_class_picker("import", "import_class_")
+# Dates travel in the callback data as yyyymmdd numbers, the format as an index into EXPORT_FORMATS
+export_class_picker = Picker(
+    "export",
+    lambda teacher_id, start, end, file_format: get_teacher_classes(teacher_id),
+    lambda class_obj, teacher_id, start, end, file_format: (
+        class_obj.name, f"export_{class_obj.id}_{start}_{end}_{file_format}"
+    ),
+    cached=True
+)
+grade_student_picker = Picker(
+    "gradestu",
+    get_class_roster,
+    lambda student, class_id: (student.full_name, f"grade_student_{class_id}_{student.id}"),
+    cached=True
+)
+grade_subject_picker = Picker(
+    "gradesub",
+    lambda class_id, student_id: get_class_subjects(class_id),
+    lambda subject, class_id, student_id: (subject.title, f"grade_subject_{class_id}_{student_id}_{subject.id}"),
+    cached=True
+)
+
+@router.message(Command("start"), flags={"unregistered": True})
+async def cmd_start(message: types.Message, state: FSMContext, user: User, command: CommandObject):
+    if not user and command.args:
+        # t.me/<bot>?start=<code> from a roster import
+        user = await claim_invite(command.args.upper(), message.from_user.id)
+        if user:
+            await message.answer(
+                f"Xush kelibsiz, {user.full_name}! Siz sinfingizga biriktirildingiz.",
+                reply_markup=get_student_keyboard()
+            )
+            return
+
     if user:
         if user.is_teacher:
             await message.answer("Xush kelibsiz, o'qituvchi!", reply_markup=get_teacher_keyboard())
@@ -76,7 +143,7 @@ async def process_full_name(message: types.Message, state: FSMContext):
             ]
         )
         
-        await message.bot.send_message(
+        outbox.send(
             chat_id=ADMIN_ID,
             text=(
                 f"👨‍🏫 Yangi o'qituvchi so'rovi:\n"
@@ -93,6 +160,16 @@ async def process_full_name(message: types.Message, state: FSMContext):
         )
         await state.set_state(UserStates.waiting_approval)
     else:
+        # A student that was imported from a roster may type the invite code instead of a name
+        user = await claim_invite(message.text.strip().upper(), message.from_user.id)
+        if user:
+            await message.answer(
+                f"Xush kelibsiz, {user.full_name}! Siz sinfingizga biriktirildingiz.",
+                reply_markup=get_student_keyboard()
+            )
+            await state.clear()
+            return
+
         # Register student immediately
         user = await User.create(
             user_id=message.from_user.id,
@@ -100,6 +177,7 @@ async def process_full_name(message: types.Message, state: FSMContext):
             is_teacher=False,
             is_student=True
         )
+        user_cache.invalidate(message.from_user.id)
         
         await message.answer(
             f"Siz o'quvchi sifatida ro'yxatdan o'tdingiz!",
@@ -129,8 +207,9 @@ async def process_teacher_approval(callback: types.CallbackQuery):
             is_teacher=True,
             is_student=False
         )
+        user_cache.invalidate(user_id)
         
-        await callback.bot.send_message(
+        outbox.send(
             chat_id=user_id,
             text="✅ Sizning o'qituvchilik so'rovingiz tasdiqlandi!"
         )
@@ -139,7 +218,7 @@ async def process_teacher_approval(callback: types.CallbackQuery):
         )
     else:
         # Reject teacher registration
-        await callback.bot.send_message(
+        outbox.send(
             chat_id=user_id,
             text="❌ Kechirasiz, sizning o'qituvchilik so'rovingiz rad etildi."
         )
@@ -151,8 +230,7 @@ async def process_teacher_approval(callback: types.CallbackQuery):
 
 # O'qituvchi uchun fan qo'shish
 @router.message(F.text == "➕ Fan qo'shish")
-async def add_subject_handler(message: types.Message, state: FSMContext):
-    user = await User.get(user_id=message.from_user.id)
+async def add_subject_handler(message: types.Message, state: FSMContext, user: User):
     if not user.is_teacher:
         await message.answer("Bu funksiya faqat o'qituvchilar uchun!")
         return
@@ -161,9 +239,7 @@ async def add_subject_handler(message: types.Message, state: FSMContext):
     await state.set_state(TeacherActions.waiting_for_subject_name)
 
 @router.message(TeacherActions.waiting_for_subject_name)
-async def process_subject_name(message: types.Message, state: FSMContext):
-    user = await User.get(user_id=message.from_user.id)
-    
+async def process_subject_name(message: types.Message, state: FSMContext, user: User):
     subject = await Subject.create(
         title=message.text,
         teacher=user
@@ -174,8 +250,7 @@ async def process_subject_name(message: types.Message, state: FSMContext):
 
 # O'qituvchi uchun sinf qo'shish
 @router.message(F.text == "➕ Sinf qo'shish")
-async def add_class_handler(message: types.Message, state: FSMContext):
-    user = await User.get(user_id=message.from_user.id)
+async def add_class_handler(message: types.Message, state: FSMContext, user: User):
     if not user.is_teacher:
         await message.answer("Bu funksiya faqat o'qituvchilar uchun!")
         return
@@ -184,9 +259,7 @@ async def add_class_handler(message: types.Message, state: FSMContext):
     await state.set_state(TeacherActions.waiting_for_class_name)
 
 @router.message(TeacherActions.waiting_for_class_name)
-async def process_class_name(message: types.Message, state: FSMContext):
-    user = await User.get(user_id=message.from_user.id)
-    
+async def process_class_name(message: types.Message, state: FSMContext, user: User):
     # Check if a class with the same name already exists
     existing_class = await Class.filter(name=message.text, teacher=user).first()
     if existing_class:
@@ -202,38 +275,26 @@ async def process_class_name(message: types.Message, state: FSMContext):
     await state.clear()
 
 # O'quvchi uchun sinfga a'zo bo'lish
-@router.message(F.text == "🏫 Sinfga a'zo bo'lish")
-async def join_class_handler(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
+@router.message(F.text == "🏫 Sinfga a'zo bo'lish", flags={"query_budget": 1})
+async def join_class_handler(message: types.Message, user: User):
     if not user.is_student:
         await message.answer("Bu funksiya faqat o'quvchilar uchun!")
         return
     
-    classes = await Class.all()
-    if not classes:
+    keyboard = await join_class_picker.markup()
+    if not keyboard:
         await message.answer("Hozircha sinflar mavjud emas")
         return
     
-    buttons = []
-    for class_obj in classes:
-        buttons.append([
-            types.InlineKeyboardButton(
-                text=class_obj.name,
-                callback_data=f"join_class_{class_obj.id}"
-            )
-        ])
-    
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
     await message.answer("Qaysi sinfga a'zo bo'lmoqchisiz?", reply_markup=keyboard)
 
-@router.callback_query(lambda c: c.data.startswith('join_class_'))
-async def process_join_class(callback: types.CallbackQuery):
+@router.callback_query(lambda c: c.data.startswith('join_class_'), flags={"query_budget": 3})
+async def process_join_class(callback: types.CallbackQuery, user: User):
     class_id = int(callback.data.split('_')[2])
-    user = await User.get(user_id=callback.from_user.id)
     class_obj = await Class.get(id=class_id)
     
     # Add student to class
-    await class_obj.students.add(user)
+    await enroll_student(class_obj, user)
     
     await callback.message.edit_text(
         f"Siz {class_obj.name} sinfiga muvaffaqiyatli a'zo bo'ldingiz!",
@@ -241,169 +302,67 @@ async def process_join_class(callback: types.CallbackQuery):
     )
 
 # Natijalarni ko'rish
-@router.message(F.text == "📊 Natijalar")
-async def show_results(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
-    
+@router.message(F.text == "📊 Natijalar", flags={"rate_limit": "report", "query_budget": 1})
+async def show_results(message: types.Message, user: User):
     if user.is_teacher:
         # O'qituvchi uchun sinflarni ko'rsatish
-        classes = await Class.filter(teacher=user)
-        if not classes:
+        keyboard = await results_class_picker.markup(user.id)
+        if not keyboard:
             await message.answer("Siz hali sinf qo'shmagansiz")
             return
             
-        buttons = []
-        for class_obj in classes:
-            buttons.append([
-                types.InlineKeyboardButton(
-                    text=class_obj.name,
-                    callback_data=f"class_results_{class_obj.id}"
-                )
-            ])
-        
-        keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await message.answer("Qaysi sinfning natijalarini ko'rmoqchisiz?", reply_markup=keyboard)
     else:
-        # O'quvchi uchun o'zining natijalarini ko'rsatish
-        grades = await Grade.filter(student=user).prefetch_related('subject')
-        if not grades:
+        # O'quvchi uchun o'zining baholari, fanlar bo'yicha bitta so'rov bilan
+        text, markup = await student_results_report.open(user.id)
+        if text is None:
             await message.answer("Sizda hali baholar yo'q")
             return
             
-        text = "📊 Sizning baholaringiz:\n\n"
-        subjects_grades = {}
-        
-        for grade in grades:
-            if grade.subject.title not in subjects_grades:
-                subjects_grades[grade.subject.title] = []
-            subjects_grades[grade.subject.title].append(grade.value)
-        
-        for subject, values in subjects_grades.items():
-            average = sum(values) / len(values)
-            text += f"📚 {subject}:\n"
-            text += f"Baholar: {', '.join(map(str, values))}\n"
-            text += f"O'rtacha: {average:.1f}\n\n"
-        
-        await message.answer(text)
+        await message.answer(text, reply_markup=markup)
 
-@router.callback_query(lambda c: c.data.startswith('class_results_'))
-async def process_class_results(callback: types.CallbackQuery):
+# The ownership check reads the teacher's classes, usually from the picker's cache
+@router.callback_query(lambda c: c.data.startswith('class_results_'), flags={"rate_limit": "report", "query_budget": 2})
+async def process_class_results(callback: types.CallbackQuery, user: User):
     class_id = int(callback.data.split('_')[2])
-    class_obj = await Class.get(id=class_id).prefetch_related('students')
-    
-    if not class_obj.students:
-        await callback.message.edit_text("Bu sinfda hali o'quvchilar yo'q")
+    if not await class_results_report.allowed(user, class_id):
+        await callback.answer(NOT_ALLOWED, show_alert=True)
+        return
+    # Counts and averages come from a single GROUP BY query
+    text, markup = await class_results_report.open(class_id)
+    if text is None:
+        await callback.answer("Sinf topilmadi", show_alert=True)
         return
-        
-    text = f"📊 {class_obj.name} sinfi natijalari:\n\n"
-    
-    for student in await class_obj.students.all():
-        grades = await Grade.filter(student=student).prefetch_related('subject')
-        if grades:
-            text += f"👤 {student.full_name}:\n"
-            subjects_grades = {}
-            
-            for grade in grades:
-                if grade.subject.title not in subjects_grades:
-                    subjects_grades[grade.subject.title] = []
-                subjects_grades[grade.subject.title].append(grade.value)
-            
-            for subject, values in subjects_grades.items():
-                average = sum(values) / len(values)
-                text += f"  📚 {subject}: {average:.1f}\n"
-            text += "\n"
     
-    await callback.message.edit_text(text)
+    await callback.message.edit_text(text, reply_markup=markup)
 
 # Davomat
-@router.message(F.text == "✅ Davomat")
-async def show_attendance(message: types.Message):
+@router.message(F.text == "✅ Davomat", flags={"rate_limit": "report"})
+async def show_attendance(message: types.Message, user: User):
     try:
         logger.info(f"Showing attendance for user {message.from_user.id}")
-        user = await User.get(user_id=message.from_user.id)
-        
         if not user.is_teacher:
-            # O'quvchi uchun o'zining davomati
-            from datetime import datetime
-            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            start_of_month = today.replace(day=1)
-            
-            attendances = await Attendance.filter(
-                user=user,
-                date__gte=start_of_month
-            ).prefetch_related('class_id')
-            
-            if not attendances:
+            # O'quvchi uchun o'zining davomati, oylik jamlanmadan o'qiladi
+            text, markup = await student_attendance_report.open(user.id)
+            if text is None:
                 await message.answer("Bu oy uchun davomat ma'lumotlari yo'q")
                 return
                 
-            text = f"📅 {today.strftime('%B %Y')} oyi davomati:\n\n"
-            present_count = sum(1 for a in attendances if a.is_present)
-            absent_count = len(attendances) - present_count
-            
-            text += f"✅ Kelgan kunlar: {present_count}\n"
-            text += f"❌ Kelmagan kunlar: {absent_count}\n"
-            text += f"📊 Davomat foizi: {(present_count/len(attendances)*100):.1f}%\n\n"
-            
-            # Kunlik davomat
-            text += "Kunlik davomat:\n"
-            for attendance in sorted(attendances, key=lambda x: x.date):
-                status = "✅ Keldi" if attendance.is_present else "❌ Kelmadi"
-                text += f"{attendance.date.strftime('%d.%m.%Y')}: {status}\n"
-                
-            await message.answer(text)
+            await message.answer(text, reply_markup=markup)
             
         else:
             # O'qituvchi uchun sinf tanlash
-            classes = await Class.filter(teacher=user)
-            if not classes:
+            keyboard = await attendance_class_picker.markup(user.id)
+            if not keyboard:
                 await message.answer("Siz hali sinf qo'shmagansiz")
                 return
                 
-            buttons = []
-            for class_obj in classes:
-                buttons.append([
-                    types.InlineKeyboardButton(
-                        text=class_obj.name,
-                        callback_data=f"attendance_{class_obj.id}"
-                    )
-                ])
-            
-            keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
             await message.answer("Qaysi sinfning davomatini ko'rmoqchisiz?", reply_markup=keyboard)
             
     except Exception as e:
         logger.error(f"Error in show_attendance: {e}")
         await message.answer("Xatolik yuz berdi")
 
-@router.callback_query(lambda c: c.data.startswith('attendance_'))
-async def process_attendance(callback: types.CallbackQuery):
-    class_id = int(callback.data.split('_')[1])
-    class_obj = await Class.get(id=class_id).prefetch_related('students')
-    
-    if not class_obj.students:
-        await callback.message.edit_text("Bu sinfda hali o'quvchilar yo'q")
-        return
-    
-    buttons = []
-    for student in await class_obj.students.all():
-        buttons.append([
-            types.InlineKeyboardButton(
-                text=f"✅ {student.full_name}",
-                callback_data=f"markpresent_{class_id}_{student.id}"
-            ),
-            types.InlineKeyboardButton(
-                text=f"❌ {student.full_name}",
-                callback_data=f"markabsent_{class_id}_{student.id}"
-            )
-        ])
-    
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-    await callback.message.edit_text(
-        "O'quvchilarning bugungi davomatini belgilang:",
-        reply_markup=keyboard
-    )
-
 @router.callback_query(lambda c: c.data.startswith(('markpresent_', 'markabsent_')))
 async def process_attendance_mark(callback: types.CallbackQuery):
     try:
@@ -421,22 +380,9 @@ async def process_attendance_mark(callback: types.CallbackQuery):
         is_present = action == 'markpresent'
         
         student = await User.get(id=int(student_id))
-        class_obj = await Class.get(id=int(class_id))
-        
-        # Check if attendance already exists for today
-        from datetime import datetime
-        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         
-        attendance = await Attendance.get_or_create(
-            user=student,
-            class_id=class_obj,
-            date=today,
-            defaults={'is_present': is_present}
-        )
-        
-        if not attendance[1]:  # If attendance already existed
-            attendance[0].is_present = is_present
-            await attendance[0].save()
+        # Idempotent: a double tap or retried callback rewrites the same row
+        await upsert_attendance(student.id, int(class_id), datetime.now().date(), is_present)
         
         status = "✅ Keldi" if is_present else "❌ Kelmadi"
         await callback.answer(f"{student.full_name}: {status}")
@@ -445,28 +391,17 @@ async def process_attendance_mark(callback: types.CallbackQuery):
         logger.error(f"Error processing attendance mark: {e}")
         await callback.answer(f"Xatolik yuz berdi: {str(e)}")
 
-@router.message(F.text == "📊 Baholar")
-async def show_grades(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
+@router.message(F.text == "📊 Baholar", flags={"rate_limit": "report"})
+async def show_grades(message: types.Message, user: User):
     today = datetime.now().date()
     
     if user.is_teacher:
         # O'qituvchi uchun: Sinfdagi barcha o'quvchilarning bugungi baholarini ko'rsatish
-        classes = await Class.filter(teacher=user)
-        if not classes:
+        keyboard = await grades_class_picker.markup(user.id)
+        if not keyboard:
             await message.answer("Siz hali sinf yaratmagansiz!")
             return
         
-        buttons = []
-        for class_obj in classes:
-            buttons.append([
-                types.InlineKeyboardButton(
-                    text=class_obj.name,
-                    callback_data=f"view_class_grades_{class_obj.id}"
-                )
-            ])
-        
-        keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await message.answer("Qaysi sinfning bugungi baholarini ko'rmoqchisiz?", reply_markup=keyboard)
     else:
         # O'quvchi uchun: Faqat bugungi baholarni ko'rsatish
@@ -485,79 +420,43 @@ async def show_grades(message: types.Message):
         
         await message.answer(text)
 
-@router.callback_query(lambda c: c.data.startswith('view_class_grades_'))
-async def show_class_grades(callback: types.CallbackQuery):
+@router.callback_query(lambda c: c.data.startswith('view_class_grades_'), flags={"rate_limit": "report"})
+async def show_class_grades(callback: types.CallbackQuery, user: User):
     class_id = int(callback.data.split('_')[3])
-    class_obj = await Class.get(id=class_id)
-    
-    grades = await Grade.filter(
-        class_id=class_id
-    ).prefetch_related('student', 'subject')
+    if not await class_grades_report.allowed(user, class_id):
+        await callback.answer(NOT_ALLOWED, show_alert=True)
+        return
     
-    if not grades:
+    text, markup = await class_grades_report.open(class_id)
+    if text is None:
         await callback.message.edit_text("Bu sinfda hali baholar yo'q!")
         return
     
-    text = f"📊 {class_obj.name} sinfi baholari:\n\n"
-    current_student = None
-    
-    for grade in sorted(grades, key=lambda x: (x.student.id, x.date)):
-        if current_student != grade.student.id:
-            current_student = grade.student.id
-            text += f"\n👤 {grade.student.full_name}:\n"
-        text += f"📝 {grade.subject.title}: {grade.value} ({grade.date.strftime('%d.%m.%Y')})\n"
-    
-    # Agar xabar juda uzun bo'lsa, bir necha qismga bo'lib yuborish
-    if len(text) > 4096:
-        for x in range(0, len(text), 4096):
-            await callback.message.answer(text[x:x+4096])
-    else:
-        await callback.message.edit_text(text)
+    await callback.message.edit_text(text, reply_markup=markup)
 
 # Baho qo'yish
 @router.message(F.text == "📝 Baho qo'yish")
-async def start_grade_process(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
+async def start_grade_process(message: types.Message, user: User):
     if not user.is_teacher:
         await message.answer("Faqat o'qituvchilar baho qo'ya oladi!")
         return
     
-    classes = await Class.filter(teacher=user)
-    if not classes:
+    keyboard = await grade_class_picker.markup(user.id)
+    if not keyboard:
         await message.answer("Siz hali sinf yaratmagansiz!")
         return
     
-    buttons = []
-    for class_obj in classes:
-        buttons.append([
-            types.InlineKeyboardButton(
-                text=class_obj.name,
-                callback_data=f"grade_class_{class_obj.id}"
-            )
-        ])
-    
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
     await message.answer("Qaysi sinfga baho qo'ymoqchisiz?", reply_markup=keyboard)
 
 @router.callback_query(lambda c: c.data.startswith('grade_class_'))
 async def select_student_for_grade(callback: types.CallbackQuery):
     class_id = int(callback.data.split('_')[2])
-    class_obj = await Class.get(id=class_id).prefetch_related('students')
+    keyboard = await grade_student_picker.markup(class_id)
     
-    if not class_obj.students:
+    if not keyboard:
         await callback.message.edit_text("Bu sinfda hali o'quvchilar yo'q")
         return
     
-    buttons = []
-    for student in await class_obj.students.all():
-        buttons.append([
-            types.InlineKeyboardButton(
-                text=f"{student.full_name}",
-                callback_data=f"grade_student_{class_id}_{student.id}"
-            )
-        ])
-    
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
     await callback.message.edit_text(
         "Qaysi o'quvchiga baho qo'ymoqchisiz?",
         reply_markup=keyboard
@@ -566,24 +465,12 @@ async def select_student_for_grade(callback: types.CallbackQuery):
 @router.callback_query(lambda c: c.data.startswith('grade_student_'))
 async def select_subject_for_grade(callback: types.CallbackQuery):
     class_id, student_id = map(int, callback.data.split('_')[2:])
-    class_obj = await Class.get(id=class_id)
-    teacher = await class_obj.teacher
     
-    subjects = await Subject.filter(teacher_id=teacher.id)
-    if not subjects:
+    keyboard = await grade_subject_picker.markup(class_id, student_id)
+    if not keyboard:
         await callback.message.edit_text("Siz hali birorta fan qo'shmagansiz!")
         return
     
-    buttons = []
-    for subject in subjects:
-        buttons.append([
-            types.InlineKeyboardButton(
-                text=subject.title,
-                callback_data=f"grade_subject_{class_id}_{student_id}_{subject.id}"
-            )
-        ])
-    
-    keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
     await callback.message.edit_text(
         "Qaysi fanga baho qo'ymoqchisiz?",
         reply_markup=keyboard
@@ -617,16 +504,16 @@ async def process_grade_value(message: types.Message, state: FSMContext):
     
     # Bahoni saqlash
     today = datetime.now()
-    grade = await Grade.create(
-        student=student,
-        subject=subject,
+    grade = await add_grade(
+        student,
+        subject,
+        grade_value,
         class_id=class_id,
-        value=grade_value,
         date=today.date()
     )
     
     # O'quvchiga xabar yuborish
-    await message.bot.send_message(
+    outbox.send(
         chat_id=student.user_id,
         text=f"Sizga yangi baho qo'yildi!\n\n"
              f"Fan: {subject.title}\n"
@@ -637,72 +524,169 @@ async def process_grade_value(message: types.Message, state: FSMContext):
     await message.answer(f"{student.full_name}ga {subject.title} fanidan {grade_value} baho qo'yildi!")
     await state.clear()
 
-# O'quvchi uchun kunlik baholarni ko'rish
-@router.message(F.text == "📊 Baholar")
-async def show_grades(message: types.Message):
-    user = await User.get(user_id=message.from_user.id)
-    today = datetime.now().date()
-    
-    if user.is_teacher:
-        # O'qituvchi uchun
-        classes = await Class.filter(teacher=user)
-        if not classes:
-            await message.answer("Siz hali sinf yaratmagansiz!")
-            return
-        
-        buttons = []
-        for class_obj in classes:
-            buttons.append([
-                types.InlineKeyboardButton(
-                    text=class_obj.name,
-                    callback_data=f"view_class_grades_{class_obj.id}"
-                )
-            ])
-        
-        keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-        await message.answer("Qaysi sinfning baholarini ko'rmoqchisiz?", reply_markup=keyboard)
-    else:
-        # O'quvchi uchun
-        grades = await Grade.filter(
-            student=user,
-            date=today
-        ).prefetch_related('subject')
-        
-        if not grades:
-            await message.answer("Bugun sizga hali baho qo'yilmagan!")
-            return
-        
-        text = f"📊 Bugungi baholar ({today.strftime('%d.%m.%Y')}):\n\n"
-        for grade in grades:
-            text += f"📝 {grade.subject.title}: {grade.value}\n"
-        
-        await message.answer(text)
+# Davomatni fayl qilib yuklab olish: /export [dd.mm.yyyy dd.mm.yyyy] [csv|xlsx]
+EXPORT_FORMATS = ["xlsx", "csv"]
 
-@router.callback_query(lambda c: c.data.startswith('view_class_grades_'))
-async def show_class_grades(callback: types.CallbackQuery):
-    class_id = int(callback.data.split('_')[3])
-    class_obj = await Class.get(id=class_id)
-    
-    grades = await Grade.filter(
-        class_id=class_id
-    ).prefetch_related('student', 'subject')
-    
-    if not grades:
-        await callback.message.edit_text("Bu sinfda hali baholar yo'q!")
+
+def school_year_start(today: date) -> date:
+    return date(today.year if today.month >= 9 else today.year - 1, 9, 1)
+
+
+def parse_export_args(args: str):
+    start, end = school_year_start(date.today()), date.today()
+    file_format = "xlsx"
+    dates = []
+    for arg in (args or "").split():
+        if arg.lower() in EXPORT_FORMATS:
+            file_format = arg.lower()
+        else:
+            dates.append(datetime.strptime(arg, "%d.%m.%Y").date())
+    if len(dates) == 2:
+        start, end = dates
+    elif dates:
+        raise ValueError(args)
+    return start, end, file_format
+
+
+def yyyymmdd(day: date) -> int:
+    return int(day.strftime("%Y%m%d"))
+
+
+@router.message(Command("export"), flags={"rate_limit": "report"})
+async def export_command(message: types.Message, user: User, command: CommandObject):
+    if not user or not user.is_teacher:
+        await message.answer("Bu buyruq faqat o'qituvchilar uchun")
         return
-    
-    text = f"📊 {class_obj.name} sinfi baholari:\n\n"
-    current_student = None
-    
-    for grade in sorted(grades, key=lambda x: (x.student.id, x.date)):
-        if current_student != grade.student.id:
-            current_student = grade.student.id
-            text += f"\n👤 {grade.student.full_name}:\n"
-        text += f"📝 {grade.subject.title}: {grade.value} ({grade.date.strftime('%d.%m.%Y')})\n"
-    
-    # Agar xabar juda uzun bo'lsa, bir necha qismga bo'lib yuborish
-    if len(text) > 4096:
-        for x in range(0, len(text), 4096):
-            await callback.message.answer(text[x:x+4096])
-    else:
-        await callback.message.edit_text(text)
+
+    try:
+        start, end, file_format = parse_export_args(command.args)
+    except ValueError:
+        await message.answer("Format: /export 01.09.2026 31.05.2027 xlsx")
+        return
+    if start > end:
+        await message.answer("Boshlanish sanasi tugash sanasidan keyin bo'lmasligi kerak")
+        return
+
+    keyboard = await export_class_picker.markup(
+        user.id, yyyymmdd(start), yyyymmdd(end), EXPORT_FORMATS.index(file_format)
+    )
+    if not keyboard:
+        await message.answer("Siz hali sinf qo'shmagansiz")
+        return
+
+    await message.answer(
+        f"{start:%d.%m.%Y} - {end:%d.%m.%Y} davomati ({file_format.upper()}).\nQaysi sinf?",
+        reply_markup=keyboard
+    )
+
+
+@router.callback_query(lambda c: c.data.startswith('export_'), flags={"rate_limit": "report"})
+async def process_export(callback: types.CallbackQuery, user: User):
+    _, class_id, start, end, file_format = callback.data.split('_')
+    class_obj = await Class.get_or_none(id=int(class_id), teacher_id=user.id)
+    if not class_obj:
+        await callback.answer("Sinf topilmadi", show_alert=True)
+        return
+
+    start = datetime.strptime(start, "%Y%m%d").date()
+    end = datetime.strptime(end, "%Y%m%d").date()
+    file_format = EXPORT_FORMATS[int(file_format)]
+    await callback.answer("Fayl tayyorlanmoqda...")
+
+    # The matrix is streamed into a temporary file and sent from disk
+    path = await export_attendance(class_obj.id, start, end, file_format)
+    try:
+        await callback.message.answer_document(
+            FSInputFile(path, filename=f"davomat_{class_obj.name}_{start:%Y%m%d}_{end:%Y%m%d}.{file_format}"),
+            caption=f"📋 {class_obj.name}: {start:%d.%m.%Y} - {end:%d.%m.%Y}"
+        )
+    finally:
+        os.remove(path)
+
+
+# O'quvchilar ro'yxatini fayldan yuklash: /import, sinf, keyin CSV yoki XLSX fayl
+# Har bir qator: ism familiya, ixtiyoriy Telegram ID
+MAX_ROSTER_SIZE = 1024 * 1024
+
+
+@router.message(Command("import"))
+async def import_command(message: types.Message, user: User):
+    if not user or not user.is_teacher:
+        await message.answer("Bu buyruq faqat o'qituvchilar uchun")
+        return
+
+    keyboard = await import_class_picker.markup(user.id)
+    if not keyboard:
+        await message.answer("Siz hali sinf qo'shmagansiz")
+        return
+
+    await message.answer("Qaysi sinfga o'quvchilarni yuklamoqchisiz?", reply_markup=keyboard)
+
+
+@router.callback_query(lambda c: c.data.startswith('import_class_'))
+async def process_import_class(callback: types.CallbackQuery, state: FSMContext, user: User):
+    class_id = int(callback.data.split('_')[2])
+    class_obj = await Class.get_or_none(id=class_id, teacher_id=user.id)
+    if not class_obj:
+        await callback.answer("Sinf topilmadi", show_alert=True)
+        return
+
+    await state.update_data(import_class_id=class_obj.id)
+    await state.set_state(TeacherActions.waiting_for_roster)
+    await callback.message.edit_text(
+        f"{class_obj.name} uchun CSV yoki XLSX fayl yuboring.\n"
+        "Har bir qatorda: ism familiya va ixtiyoriy Telegram ID."
+    )
+
+
+@router.message(TeacherActions.waiting_for_roster, F.document, flags={"rate_limit": "report"})
+async def process_roster_file(message: types.Message, state: FSMContext, user: User):
+    document = message.document
+    file_format = (document.file_name or "").rsplit(".", 1)[-1].lower()
+    if file_format not in READERS:
+        await message.answer("Faqat .csv yoki .xlsx fayl qabul qilinadi")
+        return
+    if document.file_size and document.file_size > MAX_ROSTER_SIZE:
+        await message.answer("Fayl juda katta (1 MB dan oshmasligi kerak)")
+        return
+
+    data = await state.get_data()
+    class_obj = await Class.get_or_none(id=data.get("import_class_id"), teacher_id=user.id)
+    await state.clear()
+    if not class_obj:
+        await message.answer("Sinf topilmadi")
+        return
+
+    handle, path = tempfile.mkstemp(suffix=f".{file_format}")
+    os.close(handle)
+    try:
+        await message.bot.download(document, destination=path)
+        result = await import_roster(class_obj, roster_rows(path, file_format))
+    except (ValueError, KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+        logger.exception("Roster import failed")
+        await message.answer("Faylni o'qib bo'lmadi, formatini tekshiring")
+        return
+    finally:
+        os.remove(path)
+
+    bot_username = (await message.bot.me()).username
+    lines = [
+        f"📥 {class_obj.name}: ro'yxat yuklandi",
+        f"✅ Yangi o'quvchilar: {len(result['created'])}",
+        f"🔗 Mavjud foydalanuvchilar biriktirildi: {len(result['linked'])}",
+        f"⚠️ Takrorlar: {len(result['duplicates'])}",
+    ]
+    for line, full_name in result["duplicates"]:
+        lines.append(f"   {line}-qator: {full_name}")
+    if result["invalid"]:
+        lines.append(f"❌ Xato qatorlar: {', '.join(map(str, result['invalid']))}")
+
+    invites = [(name, code) for name, telegram_id, code in result["created"] if telegram_id is None]
+    if invites:
+        lines.append("")
+        lines.append("Taklif havolalari (o'quvchilarga yuboring):")
+        for full_name, code in invites:
+            lines.append(f"👤 {full_name}: https://t.me/{bot_username}?start={code}")
+
+    for page in paginate(lines):
+        await message.answer(page, disable_web_page_preview=True)
@@ -0,0 +1,220 @@
+import csv
+import re
+import secrets
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from tortoise.transactions import in_transaction
+
+from app.db import execute, fetch_all
+from app.middlewares import user_cache
+from app.models import User
+from app.queries import invalidate_roster
+
+# First-row cells that mark a header line rather than a student
+HEADER_NAMES = {"ism", "f.i.sh", "fish", "full_name", "name", "o'quvchi", "telegram", "telegram_id"}
+
+INVITE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+INVITE_LENGTH = 8
+
+# Two parameters per row keeps a chunk under SQLite's 999 variable limit
+ENROLL_CHUNK = 400
+ENROLL_SQL = """
+INSERT INTO classes_users (classes_id, user_id)
+VALUES {rows}
+ON CONFLICT DO NOTHING
+"""
+
+ROSTER_SQL = """
+SELECT u.user_id, u.full_name
+FROM classes_users cu
+JOIN users u ON u.id = cu.user_id
+WHERE cu.classes_id = ?
+"""
+
+SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.split()).casefold()
+
+
+def new_invite_code() -> str:
+    return "".join(secrets.choice(INVITE_ALPHABET) for _ in range(INVITE_LENGTH))
+
+
+def read_csv(path: str):
+    # Yields the cells of each line; Excel in some locales saves with ';'
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        sample = file.read(4096)
+        file.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(file, dialect)
+
+
+def _column_index(ref: str) -> int:
+    match = re.match(r"[A-Z]+", ref)
+    if not match:
+        raise ValueError(f"bad cell reference {ref!r}")
+    index = 0
+    for char in match.group():
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+
+def read_xlsx(path: str):
+    # Yields the cells of each row of the first sheet, parsing the XML incrementally
+    with zipfile.ZipFile(path) as workbook:
+        names = workbook.namelist()
+        shared = []
+        if "xl/sharedStrings.xml" in names:
+            with workbook.open("xl/sharedStrings.xml") as file:
+                for _, element in iterparse(file):
+                    if element.tag == f"{SHEET_NS}si":
+                        shared.append("".join(text.text or "" for text in element.iter(f"{SHEET_NS}t")))
+                        element.clear()
+
+        sheets = sorted(name for name in names if name.startswith("xl/worksheets/sheet"))
+        if not sheets:
+            # The handler answers ValueError as a bad file
+            raise ValueError("the workbook has no worksheets")
+        sheet = "xl/worksheets/sheet1.xml" if "xl/worksheets/sheet1.xml" in names else sheets[0]
+        with workbook.open(sheet) as file:
+            for _, element in iterparse(file):
+                if element.tag != f"{SHEET_NS}row":
+                    continue
+                cells = []
+                for cell in element.iter(f"{SHEET_NS}c"):
+                    kind = cell.get("t")
+                    if kind == "inlineStr":
+                        value = "".join(text.text or "" for text in cell.iter(f"{SHEET_NS}t"))
+                    else:
+                        value = cell.findtext(f"{SHEET_NS}v") or ""
+                        if kind == "s" and value:
+                            if int(value) >= len(shared):
+                                raise ValueError(f"no shared string {value}")
+                            value = shared[int(value)]
+                    index = _column_index(cell.get("r")) if cell.get("r") else len(cells)
+                    cells += [""] * (index - len(cells))
+                    cells.append(value)
+                yield cells
+                element.clear()
+
+
+READERS = {"csv": read_csv, "xlsx": read_xlsx}
+
+
+def parse_telegram_id(value: str):
+    value = value.strip()
+    if not value:
+        return None
+    # Spreadsheets may store the id as a float
+    if re.fullmatch(r"\d+(\.0+)?", value):
+        return int(float(value))
+    raise ValueError(value)
+
+
+def roster_rows(path: str, file_format: str):
+    # (line, full_name, telegram_id or None); malformed lines come with a None name
+    for line, cells in enumerate(READERS[file_format](path), start=1):
+        cells = [str(cell).strip() for cell in cells]
+        if not any(cells):
+            continue
+        if line == 1 and cells[0].casefold() in HEADER_NAMES:
+            continue
+        try:
+            telegram_id = parse_telegram_id(cells[1]) if len(cells) > 1 else None
+        except ValueError:
+            yield line, None, None
+            continue
+        yield line, cells[0] or None, telegram_id
+
+
+async def import_roster(class_obj, rows) -> dict:
+    result = {"created": [], "linked": [], "duplicates": [], "invalid": []}
+
+    # Students already in the class count as duplicates too
+    seen_names = set()
+    seen_ids = set()
+    for row in await fetch_all(ROSTER_SQL, class_obj.id):
+        seen_names.add(normalize_name(row["full_name"]))
+        if row["user_id"] is not None:
+            seen_ids.add(row["user_id"])
+
+    pending = []
+    for line, full_name, telegram_id in rows:
+        if not full_name:
+            result["invalid"].append(line)
+            continue
+        name = normalize_name(full_name)
+        if name in seen_names or telegram_id in seen_ids:
+            result["duplicates"].append((line, full_name))
+            continue
+        seen_names.add(name)
+        if telegram_id is not None:
+            seen_ids.add(telegram_id)
+        pending.append((" ".join(full_name.split()), telegram_id))
+
+    if not pending:
+        return result
+
+    # Students that already registered themselves are enrolled, not created again
+    telegram_ids = [telegram_id for _, telegram_id in pending if telegram_id is not None]
+    existing = {
+        user.user_id: user
+        for user in await User.filter(user_id__in=telegram_ids)
+    } if telegram_ids else {}
+
+    new_users = []
+    enrolled = [user.id for user in existing.values()]
+    for full_name, telegram_id in pending:
+        if telegram_id in existing:
+            result["linked"].append(existing[telegram_id].full_name)
+            continue
+        new_users.append(User(
+            user_id=telegram_id,
+            full_name=full_name,
+            is_student=True,
+            invite_code=new_invite_code()
+        ))
+
+    async with in_transaction("default") as connection:
+        if new_users:
+            await User.bulk_create(new_users, batch_size=500, using_db=connection)
+            # bulk_create does not return primary keys on every backend
+            codes = [user.invite_code for user in new_users]
+            ids = {}
+            for start in range(0, len(codes), ENROLL_CHUNK):
+                chunk = codes[start:start + ENROLL_CHUNK]
+                ids.update(await User.filter(invite_code__in=chunk).using_db(connection).values_list("invite_code", "id"))
+            enrolled += [ids[code] for code in codes]
+
+        for start in range(0, len(enrolled), ENROLL_CHUNK):
+            chunk = enrolled[start:start + ENROLL_CHUNK]
+            values = []
+            for user_id in chunk:
+                values += [class_obj.id, user_id]
+            sql = ENROLL_SQL.format(rows=", ".join(["(?, ?)"] * len(chunk)))
+            await execute(sql, *values, connection=connection)
+
+    invalidate_roster(class_obj.id)
+    for user in new_users:
+        if user.user_id is not None:
+            # The sender may have been cached as unregistered
+            user_cache.invalidate(user.user_id)
+        result["created"].append((user.full_name, user.user_id, user.invite_code))
+    return result
+
+
+async def claim_invite(code: str, telegram_id: int):
+    # Links an imported student to the Telegram account that opened the invite
+    updated = await User.filter(invite_code=code, user_id__isnull=True).update(
+        user_id=telegram_id, invite_code=None
+    )
+    if not updated:
+        return None
+    user_cache.invalidate(telegram_id)
+    return await User.get(user_id=telegram_id)
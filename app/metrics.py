@@ -0,0 +1,220 @@
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+from tortoise import connections
+
+logger = logging.getLogger(__name__)
+
+# Client methods every ORM and raw query goes through
+QUERY_METHODS = ("execute_insert", "execute_many", "execute_query", "execute_query_dict", "execute_script")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    # Fixed buckets, counts are made cumulative only when rendered
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramFamily:
+    # One histogram per handler label
+    def __init__(self, name: str, documentation: str, bounds: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.bounds = bounds
+        self.series = {}
+
+    def observe(self, handler: str, value: float):
+        histogram = self.series.get(handler)
+        if histogram is None:
+            histogram = self.series[handler] = Histogram(self.bounds)
+        histogram.observe(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for handler, histogram in sorted(self.series.items()):
+            total = 0
+            for bound, count in zip((*self.bounds, "+Inf"), histogram.counts):
+                total += count
+                lines.append(f'{self.name}_bucket{{handler="{handler}",le="{bound}"}} {total}')
+            lines.append(f'{self.name}_sum{{handler="{handler}"}} {histogram.sum}')
+            lines.append(f'{self.name}_count{{handler="{handler}"}} {histogram.count}')
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.series = {}
+
+    def inc(self, handler: str):
+        self.series[handler] = self.series.get(handler, 0) + 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for handler, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{handler="{handler}"}} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.duration = HistogramFamily(
+            "bot_update_duration_seconds", "Wall time of an update, middlewares included.", LATENCY_BUCKETS
+        )
+        self.db_time = HistogramFamily(
+            "bot_update_db_seconds", "Time an update spent in database calls.", LATENCY_BUCKETS
+        )
+        self.queries = HistogramFamily(
+            "bot_update_queries", "Database statements sent per update.", QUERY_BUCKETS
+        )
+        self.errors = CounterFamily("bot_update_errors_total", "Updates whose handler raised.")
+
+    def record(self, span: "Span", elapsed: float):
+        self.duration.observe(span.handler, elapsed)
+        self.db_time.observe(span.handler, span.db_time)
+        self.queries.observe(span.handler, span.queries)
+        if span.failed:
+            self.errors.inc(span.handler)
+
+    def render(self) -> str:
+        lines = []
+        for family in (self.duration, self.db_time, self.queries, self.errors):
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = Registry()
+
+
+class Span:
+    # Per update accounting, reachable from the query hook through a context variable
+    __slots__ = ("handler", "queries", "db_time", "failed", "statements")
+
+    def __init__(self):
+        self.handler = "unhandled"
+        self.queries = 0
+        self.db_time = 0.0
+        self.failed = False
+        self.statements = None  # a list while app.querylog records the handler
+
+
+_span: ContextVar = ContextVar("metrics_span", default=None)
+# Set while a query is timed, so a client method calling another one is counted once
+_in_query: ContextVar = ContextVar("metrics_in_query", default=False)
+
+
+def _timed(method):
+    async def timed(client, *args, **kwargs):
+        span = _span.get()
+        if span is None or _in_query.get():
+            return await method(client, *args, **kwargs)
+        token = _in_query.set(True)
+        started = perf_counter()
+        try:
+            return await method(client, *args, **kwargs)
+        finally:
+            span.db_time += perf_counter() - started
+            span.queries += 1
+            if span.statements is not None:
+                span.statements.append(args[0] if args else kwargs.get("query", ""))
+            _in_query.reset(token)
+
+    timed.__wrapped__ = method
+    timed.timed = True
+    return timed
+
+
+def instrument_connections():
+    # Wraps the query methods of every client class in use, transaction wrappers included.
+    # Call after Tortoise.init; queries outside an update are not accounted.
+    classes = {type(connections.get(name)) for name in connections.db_config}
+    for cls in list(classes):
+        classes.update(cls.__subclasses__())
+    for cls in classes:
+        for method in QUERY_METHODS:
+            original = cls.__dict__.get(method)
+            # Tortoise's own decorators set __wrapped__ too, so look for our marker
+            if original is not None and not getattr(original, "timed", False):
+                setattr(cls, method, _timed(original))
+
+
+_names = {}
+
+
+def handler_name(callback) -> str:
+    name = _names.get(callback)
+    if name is None:
+        module = getattr(callback, "__module__", "") or ""
+        name = _names[callback] = f"{module.removeprefix('app.handlers.')}.{callback.__qualname__}"
+    return name
+
+
+class MetricsMiddleware(BaseMiddleware):
+    # Outer update middleware: register it first so the other middlewares are measured too
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        span = Span()
+        token = _span.set(span)
+        started = perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            span.failed = True
+            raise
+        finally:
+            _span.reset(token)
+            metrics.record(span, perf_counter() - started)
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    # Inner middleware: names the update's span after the handler that was chosen
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        span = _span.get()
+        if span is not None:
+            span.handler = handler_name(data["handler"].callback)
+        return await handler(event, data)
+
+
+async def _serve_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _serve_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics on http://%s:%s/metrics", host, port)
+    return runner
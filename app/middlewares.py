@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from app.cache import MISSING, TTLCache
+from app.models import User
+
+# Telegram id -> User, shared by all handlers. Unregistered users are not cached: they may
+# register on another webhook replica, and users are never changed once they exist.
+user_cache = TTLCache(maxsize=50_000, ttl=600)
+
+
+class UserMiddleware(BaseMiddleware):
+    # Resolves the sender once per update and passes it to handlers as `user`
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user:
+            user = user_cache.get(from_user.id)
+            if user is MISSING:
+                user = await User.get_or_none(user_id=from_user.id)
+                if user is not None:
+                    user_cache.set(from_user.id, user)
+            data["user"] = user
+        return await handler(event, data)
+
+
+class RegisteredMiddleware(BaseMiddleware):
+    # Inner middleware: handlers that take `user` are only reached by registered users,
+    # handlers that serve unregistered ones too opt out with flags={"unregistered": True}
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if data.get("user") is None and "user" in data["handler"].params and not get_flag(data, "unregistered"):
+            if isinstance(event, (CallbackQuery, Message)):
+                await event.answer("⚠️ Avval ro'yxatdan o'ting: /start")
+            return None
+        return await handler(event, data)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.warned = False
+
+
+class TokenBucketLimiter:
+    # rate tokens per second refill a bucket of `capacity`; each update costs one token
+    def __init__(self, rate: float, capacity: int, maxsize: int = 100_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.maxsize = maxsize
+        # A bucket idle this long is full again and can be forgotten
+        self.idle = capacity / rate
+        self._buckets = OrderedDict()
+
+    # True if allowed, False if throttled, None if throttled and the user was already warned
+    def consume(self, key, now: float = None):
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = _Bucket(self.capacity, now)
+        else:
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        self._buckets[key] = bucket
+        self._evict(now)
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.warned = False
+            return True
+        if bucket.warned:
+            return None
+        bucket.warned = True
+        return False
+
+    def _evict(self, now: float):
+        # Buckets are ordered by last use, so idle ones sit at the front
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if len(buckets) <= self.maxsize and now - bucket.updated < self.idle:
+                break
+            del buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    # Handlers opt into a stricter budget with flags={"rate_limit": "report"}
+    def __init__(self, limiters: Dict[str, TokenBucketLimiter] = None):
+        self.limiters = limiters or {
+            "default": TokenBucketLimiter(rate=2, capacity=10),
+            "report": TokenBucketLimiter(rate=0.2, capacity=3),
+        }
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if not from_user:
+            return await handler(event, data)
+
+        budget = get_flag(data, "rate_limit", default="default")
+        allowed = self.limiters[budget].consume(from_user.id)
+        if allowed:
+            return await handler(event, data)
+
+        if allowed is False and isinstance(event, (CallbackQuery, Message)):
+            await event.answer("Iltimos, biroz kuting va qayta urinib ko'ring.")
+        elif isinstance(event, CallbackQuery):
+            await event.answer()
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    # Writes the FSM changes of one update to the database in a single batch
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        token = self.storage.begin()
+        try:
+            return await handler(event, data)
+        finally:
+            await self.storage.flush(token)
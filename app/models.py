@@ -1,8 +1,16 @@
 from tortoise import fields, models
 
+# Tortoise only indexes the implicit M2M table as unique (classes_id, user_id).
+# A student's classes are looked up by user_id, so generate mode adds this one too.
+M2M_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS "idx_classes_use_user_id_9d33e6" ON "classes_users" ("user_id", "classes_id")',
+)
+
 class User(models.Model):
     id = fields.IntField(pk=True)
-    user_id = fields.BigIntField(unique=True, description="Telegram user ID")
+    # Empty for students imported from a roster until they open the bot
+    user_id = fields.BigIntField(unique=True, null=True, description="Telegram user ID")
+    invite_code = fields.CharField(max_length=16, unique=True, null=True, description="Roster invite code")
     full_name = fields.CharField(max_length=255)
     is_student = fields.BooleanField(default=False)
     is_teacher = fields.BooleanField(default=False)
@@ -23,6 +31,7 @@ class Class(models.Model):
 
     class Meta:
         table = "classes"
+        indexes = (("teacher",),)  # a teacher's classes on every picker
 
     def __str__(self):
         return self.name
@@ -35,6 +44,38 @@ class Subject(models.Model):
 
     class Meta:
         table = "subjects"
+        indexes = (("teacher",),)
+
+    def __str__(self):
+        return self.title
+
+class Exam(models.Model):
+    id = fields.IntField(pk=True)
+    title = fields.CharField(max_length=255)
+    subject = fields.ForeignKeyField('models.Subject', related_name='exams')
+    teacher = fields.ForeignKeyField('models.User', related_name='exams')
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "exams"
+        indexes = (("subject",),)
+
+    def __str__(self):
+        return self.title
+
+class Lesson(models.Model):
+    id = fields.IntField(pk=True)
+    title = fields.CharField(max_length=255)
+    description = fields.TextField()
+    days = fields.CharField(max_length=20, null=True)
+    class_id = fields.ForeignKeyField('models.Class', related_name='lessons')
+    subject = fields.ForeignKeyField('models.Subject', related_name='lessons')
+    teacher = fields.ForeignKeyField('models.User', related_name='lessons')
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "lessons"
+        indexes = (("class_id",),)
 
     def __str__(self):
         return self.title
@@ -43,25 +84,72 @@ class Attendance(models.Model):
     id = fields.IntField(pk=True)
     user = fields.ForeignKeyField('models.User', related_name='attendances')
     class_id = fields.ForeignKeyField('models.Class', related_name='attendances')
-    date = fields.DatetimeField(auto_now_add=True)
+    day = fields.DateField(description="Attendance day")
+    marked_at = fields.DatetimeField(auto_now=True)
     is_present = fields.BooleanField(default=False)
 
     class Meta:
         table = "attendances"
-        unique_together = (("user", "class_id", "date"),)
+        # One mark per student per day; class_id and day lead so per-day roster lookups use the index
+        unique_together = (("class_id", "day", "user"),)
 
     def __str__(self):
-        return f"{self.user.full_name} - {self.class_id.name} - {self.date.strftime('%d.%m.%Y')}"
+        return f"{self.user.full_name} - {self.class_id.name} - {self.day.strftime('%d.%m.%Y')}"
+
+class AttendanceMonthly(models.Model):
+    # Per student, class and month counts, refreshed together with every attendance write
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField('models.User', related_name='attendance_months')
+    class_id = fields.ForeignKeyField('models.Class', related_name='attendance_months')
+    month = fields.DateField(description="First day of the month")
+    present = fields.IntField(default=0)
+    absent = fields.IntField(default=0)
+    unmarked = fields.IntField(default=0)  # days the class was marked but this student was not
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "attendance_monthly"
+        unique_together = (("user", "class_id", "month"),)
 
 class Grade(models.Model):
     id = fields.IntField(pk=True)
     student = fields.ForeignKeyField('models.User', related_name='grades')
     subject = fields.ForeignKeyField('models.Subject', related_name='grades')
+    exam = fields.ForeignKeyField('models.Exam', related_name='grades', null=True)
+    lesson = fields.ForeignKeyField('models.Lesson', related_name='grades', null=True)
     value = fields.IntField()  # 1-5 oraliqda baho
     created_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
         table = "grades"
+        # A student's gradebook per subject, and an exam's results
+        indexes = (("student", "subject"), ("exam",))
 
     def __str__(self):
         return f"{self.student.full_name} - {self.subject.title}: {self.value}"
+
+class GradeStat(models.Model):
+    # Rollup of a student's lesson grades (1-5) in one subject, updated together with every
+    # Grade insert. Exam scores (0-100) are not rolled up.
+    id = fields.IntField(pk=True)
+    student = fields.ForeignKeyField('models.User', related_name='grade_stats')
+    subject = fields.ForeignKeyField('models.Subject', related_name='grade_stats')
+    grade_count = fields.IntField(default=0)
+    total = fields.IntField(default=0)  # sum of values
+    min_value = fields.IntField()
+    max_value = fields.IntField()
+    last_value = fields.IntField()
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "grade_stats"
+        unique_together = (("student", "subject"),)
+
+class FSMRecord(models.Model):
+    key = fields.CharField(max_length=255, pk=True)
+    state = fields.CharField(max_length=255, null=True)
+    data = fields.TextField(default="{}")  # JSON encoded FSM data
+    updated_at = fields.DatetimeField(auto_now=True, index=True)  # used to expire abandoned states
+
+    class Meta:
+        table = "fsm_states"
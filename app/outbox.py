@@ -0,0 +1,143 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_TEXT_LENGTH = 4096
+
+
+class Outbox:
+    # Notifications for other users go through here instead of an inline bot.send_message,
+    # so the handler returns at once and bursts stay within Telegram's limits:
+    # about 30 messages per second overall and one per second to the same chat.
+    # Texts waiting for the same chat are merged into one message.
+    def __init__(self, rate: float = 30, chat_interval: float = 1.0,
+                 max_attempts: int = 5, backoff: float = 1.0):
+        self.interval = 1 / rate
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.bot = None
+        self._queues = {}        # chat_id -> deque of [text, reply_markup, attempts]
+        self._ready = []         # heap of (ready_at, seq, chat_id), one entry per scheduled chat
+        self._scheduled = set()  # chats in _ready or being sent right now
+        self._seq = itertools.count()
+        self._next_send = 0.0
+        self._wakeup = asyncio.Event()
+        self._sending = set()
+        self._worker = None
+
+    def start(self, bot: Bot):
+        self.bot = bot
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def send(self, chat_id: int, text: str, reply_markup=None):
+        # Students imported from a roster have no chat until they open the bot
+        if chat_id is None:
+            return
+        # Messages with a keyboard are never merged, plain texts are
+        self._queues.setdefault(chat_id, deque()).append([text, reply_markup, 0])
+        if chat_id not in self._scheduled:
+            self._schedule(chat_id, time.monotonic())
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _schedule(self, chat_id: int, ready_at: float):
+        self._scheduled.add(chat_id)
+        heapq.heappush(self._ready, (ready_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    @staticmethod
+    def _take(queue: deque) -> list:
+        message = queue.popleft()
+        if message[1] is not None:
+            return message
+
+        while queue and queue[0][1] is None:
+            text = message[0] + "\n\n" + queue[0][0]
+            if len(text) > MAX_TEXT_LENGTH:
+                break
+            message = [text, None, max(message[2], queue.popleft()[2])]
+        return message
+
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            ready_at, _, chat_id = self._ready[0]
+            delay = max(ready_at, self._next_send) - time.monotonic()
+            if delay > 0:
+                # A newly scheduled chat may be due earlier, so wake up on send() too
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._ready)
+            queue = self._queues.get(chat_id)
+            if not queue:
+                # The chat's cooldown is over and nothing new arrived
+                self._scheduled.discard(chat_id)
+                self._queues.pop(chat_id, None)
+                continue
+
+            self._next_send = time.monotonic() + self.interval
+            task = asyncio.create_task(self._deliver(chat_id, self._take(queue)))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _deliver(self, chat_id: int, message: list):
+        text, reply_markup, attempts = message
+        ready_at = time.monotonic() + self.chat_interval
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+        except TelegramRetryAfter as e:
+            logger.warning(f"Flood control for chat {chat_id}, retrying in {e.retry_after}s")
+            self._queues[chat_id].appendleft(message)
+            ready_at = time.monotonic() + e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if attempts + 1 < self.max_attempts:
+                message[2] = attempts + 1
+                self._queues[chat_id].appendleft(message)
+                ready_at = time.monotonic() + self.backoff * 2 ** attempts
+            else:
+                logger.error(f"Giving up on message to chat {chat_id}: {e}")
+        except TelegramAPIError as e:
+            # Blocked bot, deleted chat, bad markup: retrying will not help
+            logger.warning(f"Message to chat {chat_id} was dropped: {e}")
+        except Exception as e:
+            logger.exception(f"Unexpected error while sending to chat {chat_id}: {e}")
+        finally:
+            # Reschedule even when the queue is empty to keep the per-chat interval
+            self._schedule(chat_id, ready_at)
+
+    async def close(self, timeout: float = 10):
+        # Give queued notifications a chance to go out before shutdown
+        deadline = time.monotonic() + timeout
+        while (self.pending() or self._sending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.pending():
+            logger.warning(f"{self.pending()} notifications were not sent before shutdown")
+
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+
+outbox = Outbox()
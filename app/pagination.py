@@ -0,0 +1,76 @@
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+PAGE_SIZE = 8
+
+# name -> Picker, used by the page: callback handler to rebuild a keyboard
+pickers = {}
+
+
+class Picker:
+    # A list keyboard that loads one page at a time with keyset pagination (id > last_id),
+    # so it never reads the whole table and stays within Telegram's keyboard limits.
+    # The cursor is carried in the navigation buttons: page:<name>:<args>:<cursor>,
+    # where the cursor is ">id" for the next page and "<id" for the previous one.
+    def __init__(self, name: str, query, button, page_size: int = PAGE_SIZE, cached: bool = False):
+        # query(*args) returns a queryset, button(obj, *args) returns (text, callback_data).
+        # With cached=True query(*args) returns a short list ordered by id from app.queries'
+        # cache instead, and the pages are cut from it with the same cursors.
+        self.name = name
+        self.query = query
+        self.button = button
+        self.page_size = page_size
+        self.cached = cached
+        pickers[name] = self
+
+    async def fetch(self, *args, after: int = 0, before: int = None):
+        if self.cached:
+            return self._slice(await self.query(*args), after, before)
+
+        queryset = self.query(*args)
+        if before is None:
+            rows = await queryset.filter(id__gt=after).order_by("id").limit(self.page_size + 1)
+            has_prev, has_next = after > 0, len(rows) > self.page_size
+            return rows[:self.page_size], has_prev, has_next
+
+        rows = await queryset.filter(id__lt=before).order_by("-id").limit(self.page_size + 1)
+        has_prev, has_next = len(rows) > self.page_size, True
+        return rows[:self.page_size][::-1], has_prev, has_next
+
+    def _slice(self, rows: list, after: int, before: int):
+        if before is None:
+            rows = [row for row in rows if row.id > after]
+            return rows[:self.page_size], after > 0, len(rows) > self.page_size
+
+        rows = [row for row in rows if row.id < before]
+        return rows[-self.page_size:], len(rows) > self.page_size, True
+
+    async def markup(self, *args, after: int = 0, before: int = None):
+        # None when the page is empty, so callers can show their "nothing here" text
+        rows, has_prev, has_next = await self.fetch(*args, after=after, before=before)
+        if not rows:
+            return None
+
+        keyboard = []
+        for row in rows:
+            text, callback_data = self.button(row, *args)
+            keyboard.append([InlineKeyboardButton(text=text, callback_data=callback_data)])
+
+        prefix = f"page:{self.name}:{','.join(map(str, args))}"
+        navigation = []
+        if has_prev:
+            navigation.append(InlineKeyboardButton(text="◀️", callback_data=f"{prefix}:<{rows[0].id}"))
+        if has_next:
+            navigation.append(InlineKeyboardButton(text="▶️", callback_data=f"{prefix}:>{rows[-1].id}"))
+        if navigation:
+            keyboard.append(navigation)
+
+        return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def parse_page(data: str):
+    # page:<name>:<args>:<cursor> -> (picker, args, after, before)
+    _, name, args, cursor = data.split(":")
+    args = [int(arg) for arg in args.split(",") if arg]
+    if cursor.startswith("<"):
+        return pickers.get(name), args, 0, int(cursor[1:])
+    return pickers.get(name), args, int(cursor[1:]), None
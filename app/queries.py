@@ -0,0 +1,185 @@
+from datetime import date
+
+from tortoise.expressions import Subquery
+from tortoise.signals import post_delete, post_save
+
+from app.cache import AsyncQueryCache
+from app.db import fetch_all
+from app.models import Class, Subject, User
+
+# Teacher class lists, class rosters and subject lists behind the pickers of almost
+# every teacher screen. Lists are ordered by id, so the pickers page them by cursor.
+query_cache = AsyncQueryCache(maxsize=5_000, ttl=300)
+
+# Roster of a class with each student's mark for the given day, in one LEFT JOIN.
+# is_present is None for students that are not marked yet.
+ROSTER_STATUS_SQL = """
+SELECT u.id, u.full_name, a.is_present
+FROM classes_users cu
+JOIN users u ON u.id = cu.user_id
+LEFT JOIN attendances a
+    ON a.user_id = cu.user_id
+    AND a.class_id_id = cu.classes_id
+    AND a.day = ?
+WHERE cu.classes_id = ?
+ORDER BY u.full_name, u.id
+"""
+
+
+async def load_roster_status(class_id: int, day: date = None) -> list:
+    rows = await fetch_all(ROSTER_STATUS_SQL, day or date.today(), class_id)
+    return [
+        {
+            "id": row["id"],
+            "full_name": row["full_name"],
+            "is_present": None if row["is_present"] is None else bool(row["is_present"]),
+        }
+        for row in rows
+    ]
+
+
+# Per-student, per-subject grade count and average for a class, read from the
+# grade_stats rollup: one row per student and subject however many grades exist.
+# LEFT JOINs keep a row for the class itself and for students without grades,
+# so the report can tell an empty class from a class without grades.
+CLASS_RESULTS_SQL = """
+SELECT c.name AS class_name, u.id AS student_id, u.full_name,
+    s.title AS subject, gs.grade_count, gs.total
+FROM classes c
+LEFT JOIN classes_users cu ON cu.classes_id = c.id
+LEFT JOIN users u ON u.id = cu.user_id
+LEFT JOIN grade_stats gs ON gs.student_id = u.id
+LEFT JOIN subjects s ON s.id = gs.subject_id
+WHERE c.id = ?
+ORDER BY u.full_name, u.id, s.title
+"""
+
+# Every lesson grade of one student, grouped by subject in order. The student's own
+# screen lists the grades themselves, so they are read from grades, not the rollup.
+STUDENT_RESULTS_SQL = """
+SELECT s.id AS subject_id, s.title AS subject, g.value
+FROM grades g
+JOIN subjects s ON s.id = g.subject_id
+WHERE g.student_id = ? AND g.exam_id IS NULL
+ORDER BY s.title, s.id, g.created_at, g.id
+"""
+
+
+def _subject_result(row) -> dict:
+    return {
+        "subject": row["subject"],
+        "count": row["grade_count"],
+        "average": row["total"] / row["grade_count"],
+    }
+
+
+async def load_class_results(class_id: int):
+    # None for an unknown class, otherwise (class name, students) where every student is
+    # {id, full_name, subjects: [{subject, count, average}]} and subjects may be empty
+    rows = await fetch_all(CLASS_RESULTS_SQL, class_id)
+    if not rows:
+        return None
+
+    students = {}
+    for row in rows:
+        if row["student_id"] is None:
+            continue
+        student = students.setdefault(row["student_id"], {
+            "id": row["student_id"],
+            "full_name": row["full_name"],
+            "subjects": [],
+        })
+        if row["subject"] is not None:
+            student["subjects"].append(_subject_result(row))
+    return rows[0]["class_name"], list(students.values())
+
+
+async def load_student_results(student_id: int) -> list:
+    # [{subject, grades, count, average}] per subject, from one query
+    subjects = {}
+    for row in await fetch_all(STUDENT_RESULTS_SQL, student_id):
+        subject = subjects.setdefault(row["subject_id"], {"subject": row["subject"], "grades": []})
+        subject["grades"].append(row["value"])
+    for subject in subjects.values():
+        subject["count"] = len(subject["grades"])
+        subject["average"] = sum(subject["grades"]) / subject["count"]
+    return list(subjects.values())
+
+
+async def get_teacher_classes(teacher_id: int) -> list:
+    return await query_cache.get_or_load(
+        ("teacher_classes", teacher_id),
+        lambda: Class.filter(teacher_id=teacher_id).order_by("id")
+    )
+
+
+def class_students(class_id: int):
+    # Starts from the class row and the (classes_id, user_id) index. Filtering users
+    # on enrolled_classes__id joins from users instead and scans the whole table.
+    return User.filter(id__in=Subquery(Class.filter(id=class_id).values("students__id")))
+
+
+def class_subjects(class_id: int):
+    # Subjects of the class's teacher, looked up by teacher_id for the same reason
+    return Subject.filter(teacher_id=Subquery(Class.filter(id=class_id).values("teacher_id")))
+
+
+async def get_class_roster(class_id: int) -> list:
+    return await query_cache.get_or_load(
+        ("class_roster", class_id),
+        lambda: class_students(class_id).order_by("id")
+    )
+
+
+async def get_class_subjects(class_id: int) -> list:
+    return await query_cache.get_or_load(
+        ("class_subjects", class_id),
+        lambda: class_subjects(class_id).order_by("id")
+    )
+
+
+async def get_teacher_subjects(teacher_id: int) -> list:
+    return await query_cache.get_or_load(
+        ("teacher_subjects", teacher_id),
+        lambda: Subject.filter(teacher_id=teacher_id).order_by("id")
+    )
+
+
+async def enroll_student(class_obj, student):
+    # Tortoise sends no signals for M2M changes, so the roster is invalidated here
+    await class_obj.students.add(student)
+    invalidate_roster(class_obj.id)
+
+
+def invalidate_roster(class_id: int):
+    query_cache.invalidate(("class_roster", class_id))
+
+
+@post_save(Class)
+async def _class_saved(sender, instance, created, using_db, update_fields):
+    query_cache.invalidate(("teacher_classes", instance.teacher_id))
+    query_cache.invalidate(("class_subjects", instance.id))
+
+
+@post_delete(Class)
+async def _class_deleted(sender, instance, using_db):
+    query_cache.invalidate(("teacher_classes", instance.teacher_id))
+    query_cache.invalidate(("class_subjects", instance.id))
+    invalidate_roster(instance.id)
+
+
+async def _invalidate_subjects(teacher_id: int):
+    query_cache.invalidate(("teacher_subjects", teacher_id))
+    # A class lists the subjects of its teacher
+    for class_obj in await get_teacher_classes(teacher_id):
+        query_cache.invalidate(("class_subjects", class_obj.id))
+
+
+@post_save(Subject)
+async def _subject_saved(sender, instance, created, using_db, update_fields):
+    await _invalidate_subjects(instance.teacher_id)
+
+
+@post_delete(Subject)
+async def _subject_deleted(sender, instance, using_db):
+    await _invalidate_subjects(instance.teacher_id)
@@ -0,0 +1,74 @@
+import re
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+
+from app.metrics import Span, _span, handler_name
+
+# The same statement this many times in one handler is a query in a loop
+REPEAT_LIMIT = 3
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re.compile(r"\$\d+|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql: str) -> str:
+    # Statements that differ only in their parameters normalize to the same text
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    def __init__(self, handler: str, statements: list, problems: list):
+        self.handler = handler
+        self.statements = statements
+        self.problems = problems
+        lines = [f"{handler}: {problem}" for problem in problems]
+        lines += [f"  {count}x {sql}" for sql, count in Counter(map(normalize, statements)).most_common()]
+        super().__init__("\n".join(lines))
+
+
+def check(handler: str, statements: list, budget: int = None):
+    # Raises when the handler went over its declared budget or repeated a statement
+    problems = []
+    if budget is not None and len(statements) > budget:
+        problems.append(f"{len(statements)} queries, budget is {budget}")
+    for sql, count in Counter(map(normalize, statements)).items():
+        if count >= REPEAT_LIMIT:
+            problems.append(f"N+1: the same statement ran {count} times")
+    if problems:
+        raise QueryBudgetExceeded(handler, statements, problems)
+
+
+class QueryLogMiddleware(BaseMiddleware):
+    # Inner middleware for tests and benchmarks: records the SQL a handler sends and
+    # checks it against flags={"query_budget": n}. Queries of outer middlewares don't count.
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        span = _span.get()
+        token = None
+        if span is None:
+            # Works without MetricsMiddleware too
+            span = Span()
+            token = _span.set(span)
+        outer, span.statements = span.statements, []
+        try:
+            result = await handler(event, data)
+            statements = span.statements
+        finally:
+            span.statements = outer
+            if token is not None:
+                _span.reset(token)
+        check(handler_name(data["handler"].callback), statements, get_flag(data, "query_budget"))
+        return result
@@ -0,0 +1,339 @@
+from datetime import datetime, timedelta
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from app.cache import MISSING, TTLCache
+from app.db import fetch_all, to_date, to_datetime
+from app.models import AttendanceMonthly, Class, Lesson
+from app.queries import get_teacher_classes, load_class_results, load_student_results
+
+# Telegram counts message length in UTF-16 code units
+MAX_MESSAGE_LENGTH = 4096
+
+# Rendered pages per report key, so ◀️/▶️ reuse them instead of querying again
+report_cache = TTLCache(maxsize=1_000, ttl=300)
+
+# name -> Report, used by the report: callback handler
+reports = {}
+
+# Answer to report callbacks for another user's report
+NOT_ALLOWED = "⚠️ Bu hisobot sizga tegishli emas"
+
+
+def text_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _cut(line: str, limit: int) -> str:
+    # Longest prefix that fits, never splitting a character
+    size = 0
+    for index, char in enumerate(line):
+        size += text_length(char)
+        if size > limit:
+            return line[:index]
+    return line
+
+
+def paginate(lines, limit: int = MAX_MESSAGE_LENGTH):
+    # Packs lines into pages on line boundaries. Only a line longer than a whole
+    # page is cut. Lazy: lines are consumed only as far as the pages asked for.
+    page = []
+    size = 0
+    for line in lines:
+        while text_length(line) > limit:
+            if page:
+                yield "\n".join(page)
+                page, size = [], 0
+            head = _cut(line, limit)
+            yield head
+            line = line[len(head):]
+
+        length = text_length(line) + (1 if page else 0)
+        if size + length > limit:
+            yield "\n".join(page)
+            page, size = [line], text_length(line)
+        else:
+            page.append(line)
+            size += length
+    if page:
+        yield "\n".join(page)
+
+
+class RenderedPages:
+    def __init__(self, lines):
+        self._pages = (page.strip("\n") for page in paginate(lines))
+        self.pages = []
+        self.done = False
+
+    def get(self, number: int):
+        # Renders one page ahead to know whether ▶️ is needed
+        while len(self.pages) <= number + 1 and not self.done:
+            page = next(self._pages, None)
+            if page is None:
+                self.done = True
+            elif page:
+                self.pages.append(page)
+        text = self.pages[number] if 0 <= number < len(self.pages) else None
+        return text, number + 1 < len(self.pages)
+
+
+class Report:
+    # A long text shown one page at a time in a single message.
+    # load(*args) returns the report lines (any iterable, consumed lazily) or None.
+    # Navigation buttons carry report:<name>:<args>:<page>, and anyone can send those:
+    # allowed(user, *args) tells whether the user may read the report for these args.
+    def __init__(self, name: str, load, allowed):
+        self.name = name
+        self.load = load
+        self.allowed = allowed
+        reports[name] = self
+
+    async def page(self, args, number: int = 0, fresh: bool = False):
+        key = (self.name, *args)
+        pages = MISSING if fresh else report_cache.get(key)
+        if pages is MISSING:
+            lines = await self.load(*args)
+            pages = RenderedPages(lines or ())
+            report_cache.set(key, pages)
+        return pages.get(number)
+
+    def markup(self, args, number: int, has_next: bool):
+        prefix = f"report:{self.name}:{','.join(map(str, args))}"
+        buttons = []
+        if number > 0:
+            buttons.append(InlineKeyboardButton(text="◀️", callback_data=f"{prefix}:{number - 1}"))
+        if number > 0 or has_next:
+            buttons.append(InlineKeyboardButton(text=f"{number + 1}", callback_data=f"{prefix}:{number}"))
+        if has_next:
+            buttons.append(InlineKeyboardButton(text="▶️", callback_data=f"{prefix}:{number + 1}"))
+        return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+    async def open(self, *args):
+        # First page from fresh data; text is None when there is nothing to show
+        text, has_next = await self.page(args, fresh=True)
+        return text, self.markup(args, 0, has_next) if text else None
+
+    async def show(self, args, number: int):
+        text, has_next = await self.page(args, number)
+        return text, self.markup(args, number, has_next) if text else None
+
+
+def parse_report(data: str):
+    # report:<name>:<args>:<page> -> (report, args, page)
+    _, name, args, number = data.split(":")
+    return reports.get(name), [int(arg) for arg in args.split(",") if arg], int(number)
+
+
+# Every exam of the teacher's subjects with its grades, in one joined query.
+# Exams without grades still get a row, with NULL student and value.
+EXAM_RESULTS_SQL = """
+SELECT s.id AS subject_id, s.title AS subject, e.id AS exam_id, e.title AS exam,
+    e.created_at, u.full_name, g.value
+FROM subjects s
+JOIN exams e ON e.subject_id = s.id
+LEFT JOIN grades g ON g.exam_id = e.id
+LEFT JOIN users u ON u.id = g.student_id
+WHERE s.teacher_id = ?
+ORDER BY s.title, s.id, e.created_at, e.id, u.full_name
+"""
+
+# Every grade of the students enrolled in a class
+CLASS_GRADES_SQL = """
+SELECT u.id AS student_id, u.full_name, s.title AS subject, g.value, g.created_at
+FROM classes_users cu
+JOIN users u ON u.id = cu.user_id
+JOIN grades g ON g.student_id = u.id
+JOIN subjects s ON s.id = g.subject_id
+WHERE cu.classes_id = ?
+ORDER BY u.full_name, u.id, g.created_at, g.id
+"""
+
+# Previous months shown on the student's attendance screen
+HISTORY_MONTHS = 3
+
+
+def exam_results_lines(rows):
+    subject_id = None
+    exam_id = None
+    for row in rows:
+        if row["exam_id"] != exam_id:
+            if exam_id is not None:
+                yield ""
+            if row["subject_id"] != subject_id:
+                subject_id = row["subject_id"]
+                yield f"📚 Fan: {row['subject']}"
+                yield ""
+            exam_id = row["exam_id"]
+            yield f"📝 Imtihon: {row['exam']}"
+            yield f"📅 Sana: {to_datetime(row['created_at']).strftime('%d.%m.%Y')}"
+            if row["value"] is None:
+                yield "❌ Hali baholar qo'yilmagan"
+                continue
+        yield f"👤 {row['full_name']}: {row['value']}"
+
+
+async def load_exam_results(teacher_id: int):
+    return exam_results_lines(await fetch_all(EXAM_RESULTS_SQL, teacher_id))
+
+
+def class_grades_lines(class_name: str, rows):
+    yield f"📊 {class_name} sinfi baholari:"
+    student_id = None
+    for row in rows:
+        if row["student_id"] != student_id:
+            student_id = row["student_id"]
+            yield ""
+            yield f"👤 {row['full_name']}:"
+        date = to_datetime(row["created_at"]).strftime('%d.%m.%Y')
+        yield f"📝 {row['subject']}: {row['value']} ({date})"
+
+
+async def load_class_grades(class_id: int):
+    class_obj = await Class.get_or_none(id=class_id)
+    rows = await fetch_all(CLASS_GRADES_SQL, class_id)
+    if not class_obj or not rows:
+        return None
+    return class_grades_lines(class_obj.name, rows)
+
+
+def class_results_lines(class_name: str, students):
+    yield f"📊 {class_name} sinfi natijalari:"
+    yield ""
+    for student in students:
+        if student["subjects"]:
+            yield f"👤 {student['full_name']}:"
+            for result in student["subjects"]:
+                yield f"  📚 {result['subject']}: {result['average']:.1f}"
+            yield ""
+
+
+async def load_class_results_report(class_id: int):
+    results = await load_class_results(class_id)
+    if results is None:
+        return None
+    class_name, students = results
+    if not students:
+        return ["Bu sinfda hali o'quvchilar yo'q"]
+    return class_results_lines(class_name, students)
+
+
+# The student's marks of one month. Starts from the student's classes, so each class is
+# read through the (class_id, day, user) key instead of scanning attendances by user.
+STUDENT_DAYS_SQL = """
+SELECT a.day, a.is_present, c.name AS class_name
+FROM classes_users cu
+JOIN classes c ON c.id = cu.classes_id
+JOIN attendances a
+    ON a.class_id_id = cu.classes_id
+    AND a.day >= ?
+    AND a.user_id = cu.user_id
+WHERE cu.user_id = ?
+ORDER BY a.day, c.name
+"""
+
+
+def student_results_lines(results):
+    yield "📊 Sizning baholaringiz:"
+    yield ""
+    for result in results:
+        yield f"📚 {result['subject']}:"
+        yield f"Baholar: {', '.join(map(str, result['grades']))}"
+        yield f"O'rtacha: {result['average']:.1f}"
+        yield ""
+
+
+async def load_student_results_report(student_id: int):
+    results = await load_student_results(student_id)
+    return student_results_lines(results) if results else None
+
+
+def attendance_lines(this_month, months: dict, days):
+    present_count, absent_count, unmarked_count = months.pop(this_month)
+    yield f"📅 {this_month.strftime('%B %Y')} oyi davomati:"
+    yield ""
+    yield f"✅ Kelgan kunlar: {present_count}"
+    yield f"❌ Kelmagan kunlar: {absent_count}"
+    if unmarked_count:
+        yield f"➖ Belgilanmagan kunlar: {unmarked_count}"
+    if present_count + absent_count:
+        yield f"📊 Davomat foizi: {(present_count/(present_count + absent_count)*100):.1f}%"
+
+    if days:
+        yield ""
+        yield "Kunlik davomat:"
+        # The class is named only when the student has marks in more than one
+        with_class = len({row["class_name"] for row in days}) > 1
+        for row in days:
+            status = "✅ Keldi" if row["is_present"] else "❌ Kelmadi"
+            suffix = f" ({row['class_name']})" if with_class else ""
+            yield f"{to_date(row['day']).strftime('%d.%m.%Y')}: {status}{suffix}"
+
+    if months:
+        yield ""
+        yield "Oldingi oylar:"
+        for month, (present, absent, _) in sorted(months.items(), reverse=True):
+            percent = present / (present + absent) * 100 if present + absent else 0
+            yield f"{month.strftime('%B %Y')}: ✅ {present}, ❌ {absent} ({percent:.1f}%)"
+
+
+async def load_student_attendance(user_id: int):
+    # Read from the monthly rollup: a few rows per class, not every attendance mark
+    this_month = datetime.now().date().replace(day=1)
+    oldest_month = this_month
+    for _ in range(HISTORY_MONTHS):
+        oldest_month = (oldest_month - timedelta(days=1)).replace(day=1)
+
+    months = {}
+    for row in await AttendanceMonthly.filter(user_id=user_id, month__gte=oldest_month):
+        totals = months.setdefault(row.month, [0, 0, 0])
+        totals[0] += row.present
+        totals[1] += row.absent
+        totals[2] += row.unmarked
+
+    if this_month not in months:
+        return None
+    days = await fetch_all(STUDENT_DAYS_SQL, this_month, user_id)
+    return attendance_lines(this_month, months, days)
+
+
+def lesson_lines(title: str, lessons, with_teacher: bool):
+    yield title
+    yield ""
+    for lesson in lessons:
+        yield f"📚 {lesson.title}"
+        if with_teacher:
+            yield f"👨‍🏫 O'qituvchi: {lesson.teacher.full_name}"
+        yield f"📝 {lesson.description}"
+        yield ""
+
+
+async def load_teacher_lessons(teacher_id: int):
+    lessons = await Lesson.filter(teacher_id=teacher_id).order_by("id")
+    return lesson_lines("Sizning darslaringiz:", lessons, False) if lessons else None
+
+
+async def load_lessons():
+    lessons = await Lesson.all().order_by("id").select_related("teacher")
+    return lesson_lines("Mavjud darslar:", lessons, True) if lessons else None
+
+
+async def is_self(user, user_id: int) -> bool:
+    # The student's own grades and attendance, the teacher's own exams and lessons
+    return user.id == user_id
+
+
+async def teaches_class(user, class_id: int) -> bool:
+    return any(class_obj.id == class_id for class_obj in await get_teacher_classes(user.id))
+
+
+async def anyone(user) -> bool:
+    return True
+
+
+exam_results_report = Report("exams", load_exam_results, is_self)
+class_grades_report = Report("grades", load_class_grades, teaches_class)
+class_results_report = Report("results", load_class_results_report, teaches_class)
+student_attendance_report = Report("attendance", load_student_attendance, is_self)
+student_results_report = Report("sresults", load_student_results_report, is_self)
+teacher_lessons_report = Report("tlessons", load_teacher_lessons, is_self)
+lessons_report = Report("lessons", load_lessons, anyone)
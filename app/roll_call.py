@@ -0,0 +1,98 @@
+from datetime import date, datetime, timezone
+
+from aiogram.fsm.context import FSMContext
+from tortoise.transactions import in_transaction
+
+from app.db import execute
+from app.stats import add_attendance_marks, read_attendance_day
+
+# Roll call drafts live in the teacher's FSM data until "Saqlash" is pressed,
+# so a tap only edits the draft and never touches the database.
+# Keys are strings because FSM data must stay JSON-serializable.
+
+# Native upsert on the (class_id, day, user) unique key: one round trip, no read
+# before write, and a double tap or retried callback just rewrites the same row.
+# The syntax is shared by SQLite (3.24+) and PostgreSQL.
+UPSERT_SQL = """
+INSERT INTO attendances (user_id, class_id_id, day, is_present, marked_at)
+VALUES {rows}
+ON CONFLICT (class_id_id, day, user_id)
+DO UPDATE SET is_present = excluded.is_present, marked_at = excluded.marked_at
+"""
+
+
+async def upsert_attendances(class_id: int, day: date, marks: dict, connection=None) -> int:
+    if not marks:
+        return 0
+    if connection is None:
+        # The marks and the monthly rollup are written together or not at all
+        async with in_transaction("default") as connection:
+            return await upsert_attendances(class_id, day, marks, connection=connection)
+
+    before = await read_attendance_day(class_id, day, connection=connection)
+    marked_at = datetime.now(timezone.utc)
+    values = []
+    for student_id, is_present in marks.items():
+        values += [student_id, class_id, day, is_present, marked_at]
+
+    sql = UPSERT_SQL.format(rows=", ".join(["(?, ?, ?, ?, ?)"] * len(marks)))
+    await execute(sql, *values, connection=connection)
+    await add_attendance_marks(class_id, day, marks, before, connection=connection)
+    return len(marks)
+
+
+async def upsert_attendance(student_id: int, class_id: int, day: date, is_present: bool, connection=None):
+    await upsert_attendances(class_id, day, {student_id: is_present}, connection=connection)
+
+
+async def start_roll_call(state: FSMContext, class_obj, roster, day: date = None):
+    # roster comes from load_roster_status, so marks saved earlier are kept in the draft
+    day = day or date.today()
+    session = {
+        "class_id": class_obj.id,
+        "class_name": class_obj.name,
+        "day": day.isoformat(),
+        "students": [[student["id"], student["full_name"]] for student in roster],
+        "marks": {
+            str(student["id"]): student["is_present"]
+            for student in roster if student["is_present"] is not None
+        },
+    }
+    await state.update_data(roll_call=session)
+    return session
+
+
+async def get_roll_call(state: FSMContext):
+    data = await state.get_data()
+    return data.get("roll_call")
+
+
+async def flip_mark(state: FSMContext, student_id: int):
+    session = await get_roll_call(state)
+    if not session:
+        return None
+
+    key = str(student_id)
+    # Unmarked students become present on the first tap, then toggle
+    session["marks"][key] = not session["marks"].get(key, False)
+    await state.update_data(roll_call=session)
+    return session
+
+
+async def mark_all(state: FSMContext, is_present: bool = True):
+    session = await get_roll_call(state)
+    if not session:
+        return None
+
+    marks = {str(student_id): is_present for student_id, _ in session["students"]}
+    if marks == session["marks"]:
+        return None
+
+    session["marks"] = marks
+    await state.update_data(roll_call=session)
+    return session
+
+
+async def save_roll_call(session) -> int:
+    marks = {int(student_id): is_present for student_id, is_present in session["marks"].items()}
+    return await upsert_attendances(session["class_id"], date.fromisoformat(session["day"]), marks)
@@ -0,0 +1,178 @@
+import logging
+from datetime import datetime, timezone
+
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app.db import execute, fetch_all, get_connection
+from app.models import M2M_INDEXES
+from app.stats import rebuild_attendance_monthly, rebuild_grade_stats
+
+logger = logging.getLogger(__name__)
+
+# The migrations are written for PostgreSQL. On SQLite a table created by an older version is
+# rebuilt instead: a new table from the model, its rows copied over and the new columns filled in.
+
+# New columns filled from the columns older versions had: (table, column) -> [(expression, old column)]
+BACKFILLS = {
+    ("attendances", "day"): [('date("date")', "date")],
+    ("attendances", "marked_at"): [('"date"', "date")],
+    ("attendances", "user_id"): [('"student_id"', "student_id")],
+}
+
+# Rollup tables that start empty next to existing rows: (table, rows to roll up, rebuild)
+ROLLUPS = (
+    ("grade_stats", "SELECT 1 FROM grades WHERE exam_id IS NULL LIMIT 1", rebuild_grade_stats),
+    ("attendance_monthly", "SELECT 1 FROM attendances LIMIT 1", rebuild_attendance_monthly),
+)
+
+
+def _models():
+    return Tortoise.apps["models"].values()
+
+
+def _column(meta, name: str) -> str:
+    field = meta.fields_map[name]
+    return getattr(field, "source_field", None) or meta.fields_db_projection[name]
+
+
+async def table_problems(model, connection=None) -> list:
+    # What keeps an existing table from working with its model, [] when it matches or doesn't exist yet
+    connection = connection or get_connection()
+    meta = model._meta
+    table = meta.db_table
+    rows = await fetch_all(f'PRAGMA table_info("{table}")', connection=connection)
+    if not rows:
+        return []
+
+    columns = {row["name"]: row for row in rows}
+    projection = meta.fields_db_projection
+    problems = [f"no {table}.{column}" for column in projection.values() if column not in columns]
+    problems += [
+        f"NOT NULL {table}.{column}" for name, column in projection.items()
+        if column in columns and meta.fields_map[name].null and columns[column]["notnull"]
+    ]
+    # A dropped NOT NULL column without a default makes every insert fail
+    problems += [
+        f"leftover {table}.{name}" for name, row in columns.items()
+        if name not in projection.values() and row["notnull"] and row["dflt_value"] is None
+    ]
+
+    expected = [tuple(_column(meta, name) for name in names) for names in meta.unique_together]
+    expected += [
+        (_column(meta, name),) for name, field in meta.fields_map.items()
+        if field.unique and not field.pk and name in projection
+    ]
+    unique = set()
+    for index in await fetch_all(f'PRAGMA index_list("{table}")', connection=connection):
+        if index["unique"]:
+            info = await fetch_all(f'PRAGMA index_info("{index["name"]}")', connection=connection)
+            unique.add(frozenset(row["name"] for row in info))
+    problems += [f"no UNIQUE {table}({', '.join(names)})" for names in expected if frozenset(names) not in unique]
+    return problems
+
+
+async def _rebuild_table(model, connection):
+    meta = model._meta
+    table = meta.db_table
+    old = f"{table}__old"
+    old_columns = {row["name"] for row in await fetch_all(f'PRAGMA table_info("{table}")', connection=connection)}
+
+    columns, expressions, values = [], [], []
+    for name, column in meta.fields_db_projection.items():
+        field = meta.fields_map[name]
+        if column in old_columns:
+            expression = f'"{column}"'
+        else:
+            expression = next((sql for sql, source in BACKFILLS.get((table, column), ()) if source in old_columns), None)
+            if expression is None:
+                if field.null:
+                    continue
+                if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+                    expression, value = "?", datetime.now(timezone.utc)
+                elif field.default is not None and not callable(field.default):
+                    expression, value = "?", field.default
+                else:
+                    raise RuntimeError(f"No value for the new column {table}.{column}")
+                values.append(field.to_db_value(value, model))
+        columns.append(f'"{column}"')
+        expressions.append(expression)
+
+    # The model's indexes are created with the new table under the same names
+    for index in await fetch_all(f'PRAGMA index_list("{table}")', connection=connection):
+        if index["origin"] == "c":
+            await connection.execute_script(f'DROP INDEX "{index["name"]}"')
+    await connection.execute_script(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    generator = connection.schema_generator(connection)
+    await connection.execute_script(generator._get_table_sql(model, safe=False)["table_creation_string"])
+    # Rows that now collide on a unique key, like two marks of one day, keep the newest
+    await execute(
+        f'INSERT OR REPLACE INTO "{table}" ({", ".join(columns)}) '
+        f'SELECT {", ".join(expressions)} FROM "{old}" ORDER BY rowid',
+        *values, connection=connection
+    )
+    await connection.execute_script(f'DROP TABLE "{old}"')
+
+
+async def upgrade_tables():
+    # Rebuilds every existing table that doesn't match its model, in one transaction
+    outdated = []
+    for model in _models():
+        problems = await table_problems(model)
+        if problems:
+            outdated.append(model)
+            logger.info("Upgrading %s: %s", model._meta.db_table, ", ".join(problems))
+    if not outdated:
+        return
+
+    connection = get_connection()
+    # Foreign keys in other tables keep pointing at the table name while it is rebuilt
+    await connection.execute_script("PRAGMA foreign_keys = OFF; PRAGMA legacy_alter_table = ON")
+    try:
+        async with in_transaction("default") as transaction:
+            for model in outdated:
+                await _rebuild_table(model, transaction)
+            for model in outdated:
+                table = model._meta.db_table
+                if await fetch_all(f'PRAGMA foreign_key_check("{table}")', connection=transaction):
+                    raise RuntimeError(f"{table} has rows that reference missing rows")
+    finally:
+        await connection.execute_script("PRAGMA legacy_alter_table = OFF; PRAGMA foreign_keys = ON")
+
+
+async def backfill_rollups():
+    connection = get_connection()
+    for table, source, rebuild in ROLLUPS:
+        empty = not await fetch_all(f'SELECT 1 FROM "{table}" LIMIT 1', connection=connection)
+        if empty and await fetch_all(source, connection=connection):
+            logger.info("Backfilling %s: %s rows", table, await rebuild())
+
+
+async def schema_version(connection=None) -> int:
+    rows = await fetch_all("PRAGMA user_version", connection=connection or get_connection())
+    return rows[0]["user_version"]
+
+
+async def prepare_sqlite_schema(version: int):
+    # generate mode on SQLite. The database records the schema version it was last brought up to
+    # (the number of the latest migration) in PRAGMA user_version; when it matches, boot is that
+    # one read. Otherwise the tables of an older version are upgraded, the missing ones created,
+    # and boot is refused only if the upgrade couldn't bring the schema up to the models.
+    if await schema_version() == version:
+        return
+
+    await upgrade_tables()
+    await Tortoise.generate_schemas(safe=True)
+    for sql in M2M_INDEXES:
+        await get_connection().execute_script(sql)
+    await backfill_rollups()
+
+    problems = []
+    for model in _models():
+        problems += await table_problems(model)
+    if problems:
+        raise RuntimeError(
+            f"The SQLite database could not be upgraded: {', '.join(problems)}. "
+            "Move the database file aside to start with a new one"
+        )
+    await get_connection().execute_script(f"PRAGMA user_version = {int(version)}")
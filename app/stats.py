@@ -0,0 +1,219 @@
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+
+from tortoise.transactions import in_transaction
+
+from app.db import execute, fetch_all, to_date
+from app.models import Grade
+
+logger = logging.getLogger(__name__)
+
+# Folds one new grade into the (student, subject) rollup. CASE instead of
+# LEAST/GREATEST (or MIN/MAX) keeps it valid on both SQLite and PostgreSQL.
+GRADE_STATS_UPSERT_SQL = """
+INSERT INTO grade_stats (student_id, subject_id, grade_count, total, min_value, max_value, last_value, updated_at)
+VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (student_id, subject_id)
+DO UPDATE SET
+    grade_count = grade_stats.grade_count + 1,
+    total = grade_stats.total + excluded.total,
+    min_value = CASE WHEN excluded.min_value < grade_stats.min_value
+        THEN excluded.min_value ELSE grade_stats.min_value END,
+    max_value = CASE WHEN excluded.max_value > grade_stats.max_value
+        THEN excluded.max_value ELSE grade_stats.max_value END,
+    last_value = excluded.last_value,
+    updated_at = excluded.updated_at
+"""
+
+# The last value comes from a window over each (student, subject) partition: one
+# sort of the grades table instead of a correlated lookup per rollup row.
+# Exam scores are left out, see add_grade.
+GRADE_STATS_REBUILD_SQL = """
+INSERT INTO grade_stats (student_id, subject_id, grade_count, total, min_value, max_value, last_value, updated_at)
+SELECT student_id, subject_id, COUNT(*), SUM(value), MIN(value), MAX(value), MAX(last_value), ?
+FROM (
+    SELECT student_id, subject_id, value,
+        FIRST_VALUE(value) OVER (
+            PARTITION BY student_id, subject_id ORDER BY created_at DESC, id DESC
+        ) AS last_value
+    FROM grades
+    WHERE exam_id IS NULL
+) ranked
+GROUP BY student_id, subject_id
+"""
+
+
+# Recomputes one class's month for every enrolled student, for backfills. Days the class
+# has any mark count as held, so unmarked = held days - present - absent.
+ATTENDANCE_MONTHLY_REFRESH_SQL = """
+INSERT INTO attendance_monthly (user_id, class_id_id, month, present, absent, unmarked, updated_at)
+SELECT cu.user_id, cu.classes_id, ?,
+    SUM(CASE WHEN a.is_present THEN 1 ELSE 0 END),
+    SUM(CASE WHEN NOT a.is_present THEN 1 ELSE 0 END),
+    held.days - COUNT(a.id),
+    ?
+FROM classes_users cu
+CROSS JOIN (
+    SELECT COUNT(DISTINCT day) AS days FROM attendances
+    WHERE class_id_id = ? AND day >= ? AND day < ?
+) held
+LEFT JOIN attendances a
+    ON a.user_id = cu.user_id
+    AND a.class_id_id = cu.classes_id
+    AND a.day >= ? AND a.day < ?
+WHERE cu.classes_id = ? AND held.days > 0
+GROUP BY cu.user_id, cu.classes_id, held.days
+ON CONFLICT (user_id, class_id_id, month)
+DO UPDATE SET
+    present = excluded.present,
+    absent = excluded.absent,
+    unmarked = excluded.unmarked,
+    updated_at = excluded.updated_at
+"""
+
+
+# What a save changes in the rollup depends on the day before it: every enrolled student's
+# current mark for the day, how many days of the month the class already has marks on,
+# and whether the day is one of them
+ATTENDANCE_DAY_SQL = """
+SELECT cu.user_id, a.is_present,
+    (SELECT COUNT(DISTINCT day) FROM attendances
+     WHERE class_id_id = ? AND day >= ? AND day < ?) AS days,
+    EXISTS (SELECT 1 FROM attendances WHERE class_id_id = ? AND day = ?) AS today
+FROM classes_users cu
+LEFT JOIN attendances a
+    ON a.class_id_id = cu.classes_id
+    AND a.day = ?
+    AND a.user_id = cu.user_id
+WHERE cu.classes_id = ?
+"""
+
+# Adds per-student deltas to the month's rows. A missing row stands for a student with no
+# marks yet, so it starts from (0, 0, held days before the save): the inserted values are
+# that baseline plus the delta, and an existing row subtracts the baseline (the last ?) again.
+ATTENDANCE_MONTHLY_DELTA_SQL = """
+INSERT INTO attendance_monthly (user_id, class_id_id, month, present, absent, unmarked, updated_at)
+VALUES {rows}
+ON CONFLICT (user_id, class_id_id, month)
+DO UPDATE SET
+    present = attendance_monthly.present + excluded.present,
+    absent = attendance_monthly.absent + excluded.absent,
+    unmarked = attendance_monthly.unmarked + excluded.unmarked - ?,
+    updated_at = excluded.updated_at
+"""
+
+
+def month_range(day: date) -> tuple:
+    start = day.replace(day=1)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+async def add_grade(student, subject, value: int, **fields) -> Grade:
+    # The grade and its rollup row are written in one transaction, so they never disagree.
+    # Exam scores are out of 100 and lesson grades out of 5: only lesson grades are rolled
+    # up, so the averages on the results screens stay on one scale.
+    async with in_transaction("default") as connection:
+        grade = await Grade.create(
+            student=student, subject=subject, value=value, using_db=connection, **fields
+        )
+        if fields.get("exam") is None:
+            await execute(
+                GRADE_STATS_UPSERT_SQL,
+                student.id, subject.id, value, value, value, value, datetime.now(timezone.utc),
+                connection=connection
+            )
+    return grade
+
+
+async def rebuild_grade_stats() -> int:
+    # Recomputes every rollup row from the grades table, for backfills and repairs
+    async with in_transaction("default") as connection:
+        await execute("DELETE FROM grade_stats", connection=connection)
+        return await execute(GRADE_STATS_REBUILD_SQL, datetime.now(timezone.utc), connection=connection)
+
+
+async def refresh_attendance_month(class_id: int, day: date, connection=None) -> int:
+    start, end = month_range(day)
+    return await execute(
+        ATTENDANCE_MONTHLY_REFRESH_SQL,
+        start, datetime.now(timezone.utc), class_id, start, end, start, end, class_id,
+        connection=connection
+    )
+
+
+async def read_attendance_day(class_id: int, day: date, connection=None) -> dict:
+    # Read before the marks are written, see add_attendance_marks
+    start, end = month_range(day)
+    rows = await fetch_all(
+        ATTENDANCE_DAY_SQL, class_id, start, end, class_id, day, day, class_id, connection=connection
+    )
+    return {
+        "held": rows[0]["days"] if rows else 0,
+        "today": bool(rows and rows[0]["today"]),
+        "marks": {row["user_id"]: None if row["is_present"] is None else bool(row["is_present"]) for row in rows},
+    }
+
+
+async def add_attendance_marks(class_id: int, day: date, marks: dict, before: dict, connection=None) -> int:
+    # Folds the day's new marks into the monthly rollup as per-student deltas, so a save
+    # touches only the rows it changes. Two teachers saving the same class at the same
+    # moment can make the rollup drift; `python -m app.stats` rebuilds it.
+    deltas = []
+    for user_id, old in before["marks"].items():
+        if user_id not in marks:
+            if not before["today"]:
+                # The class is marked on a new day, and this student isn't
+                deltas.append((user_id, 0, 0, 1))
+            continue
+        new = marks[user_id]
+        if old is None:
+            # Unmarked on a day that was already held, marked now
+            deltas.append((user_id, int(new), int(not new), -1 if before["today"] else 0))
+        elif old != new:
+            deltas.append((user_id, int(new) - int(old), int(old) - int(new), 0))
+    if not deltas:
+        return 0
+
+    month, held, now = day.replace(day=1), before["held"], datetime.now(timezone.utc)
+    values = []
+    for user_id, present, absent, unmarked in deltas:
+        values += [user_id, class_id, month, present, absent, held + unmarked, now]
+    sql = ATTENDANCE_MONTHLY_DELTA_SQL.format(rows=", ".join(["(?, ?, ?, ?, ?, ?, ?)"] * len(deltas)))
+    return await execute(sql, *values, held, connection=connection)
+
+
+async def rebuild_attendance_monthly() -> int:
+    # Backfill: refreshes every month of every class that has attendance rows
+    spans = await fetch_all(
+        "SELECT class_id_id, MIN(day) AS first_day, MAX(day) AS last_day FROM attendances GROUP BY class_id_id"
+    )
+    count = 0
+    async with in_transaction("default") as connection:
+        await execute("DELETE FROM attendance_monthly", connection=connection)
+        for span in spans:
+            month, last = to_date(span["first_day"]).replace(day=1), to_date(span["last_day"])
+            while month <= last:
+                count += await refresh_attendance_month(span["class_id_id"], month, connection=connection)
+                month = month_range(month)[1]
+    return count
+
+
+async def main():
+    from main import close_db, init_db
+
+    await init_db()
+    try:
+        count = await rebuild_grade_stats()
+        logger.info(f"Rebuilt {count} grade_stats rows")
+        count = await rebuild_attendance_monthly()
+        logger.info(f"Rebuilt {count} attendance_monthly rows")
+    finally:
+        await close_db()
+
+
+if __name__ == '__main__':
+    # python -m app.stats
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import json
+import time
+from contextvars import ContextVar
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from app.cache import MISSING, TTLCache
+from app.db import execute, fetch_all
+
+UPSERT_SQL = """
+INSERT INTO fsm_states (key, state, data, updated_at)
+VALUES {rows}
+ON CONFLICT (key)
+DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+"""
+
+
+class DatabaseStorage(BaseStorage):
+    # FSM state kept in the project database, so flows survive restarts and are shared by workers.
+    # The writes of one update are buffered and flushed once by FSMFlushMiddleware, hot keys are read
+    # from a short-lived cache. cache_ttl=0 turns the cache off, for replicas that don't share a chat's updates.
+    def __init__(
+        self,
+        state_ttl: timedelta = timedelta(days=7),
+        cache_size: int = 10_000,
+        cache_ttl: float = 5,
+        purge_interval: float = 3600
+    ):
+        self.state_ttl = state_ttl
+        self.purge_interval = purge_interval
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Writes of the update being handled, every update has its own buffer
+        self._pending = ContextVar(f"fsm_pending_{id(self)}", default=None)
+        # Records whose write hasn't committed yet, read instead of the older row
+        self._flushing = {}
+        self._purged_at = time.monotonic()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id or "",
+            key.business_connection_id or "", key.destiny
+        ))
+
+    async def _load(self, key: str) -> tuple:
+        pending = self._pending.get()
+        if pending and key in pending:
+            return pending[key]
+        if key in self._flushing:
+            return self._flushing[key]
+
+        record = self._cache.get(key)
+        if record is MISSING:
+            # Abandoned flows older than state_ttl read as empty
+            rows = await fetch_all(
+                "SELECT state, data FROM fsm_states WHERE key = ? AND updated_at >= ?",
+                key, datetime.now(timezone.utc) - self.state_ttl
+            )
+            record = (rows[0]["state"], json.loads(rows[0]["data"])) if rows else (None, {})
+            self._cache.set(key, record)
+        return record
+
+    async def _write(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        record = (state, data)
+        self._cache.set(key, record)
+        pending = self._pending.get()
+        if pending is None:
+            # Outside an update there is nothing to coalesce with
+            await self._save({key: record})
+        else:
+            pending[key] = record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self._key(key)
+        _, data = await self._load(key)
+        await self._write(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        key = self._key(key)
+        state, _ = await self._load(key)
+        await self._write(key, state, deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return deepcopy(data)
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        key = self._key(key)
+        state, current = await self._load(key)
+        current = {**current, **data}
+        await self._write(key, state, current)
+        return deepcopy(current)
+
+    def begin(self):
+        # Starts buffering the writes of one update, the token is passed to flush()
+        return self._pending.set({})
+
+    async def flush(self, token=None):
+        pending = self._pending.get()
+        if token is not None:
+            self._pending.reset(token)
+        if pending:
+            await self._save(pending)
+
+        if time.monotonic() - self._purged_at > self.purge_interval:
+            self._purged_at = time.monotonic()
+            await execute(
+                "DELETE FROM fsm_states WHERE updated_at < ?",
+                datetime.now(timezone.utc) - self.state_ttl
+            )
+
+    async def _save(self, records: dict):
+        self._flushing.update(records)
+        try:
+            now = datetime.now(timezone.utc)
+            cleared = [key for key, (state, data) in records.items() if state is None and not data]
+            if cleared:
+                await execute(
+                    f"DELETE FROM fsm_states WHERE key IN ({', '.join(['?'] * len(cleared))})",
+                    *cleared
+                )
+
+            values = []
+            for key, (state, data) in records.items():
+                if state is not None or data:
+                    values += [key, state, json.dumps(data, ensure_ascii=False), now]
+            if values:
+                rows = ", ".join(["(?, ?, ?, ?)"] * (len(values) // 4))
+                await execute(UPSERT_SQL.format(rows=rows), *values)
+        finally:
+            for key, record in records.items():
+                # A later write to the key replaced the record and is still on its way
+                if self._flushing.get(key) is record:
+                    del self._flushing[key]
+
+    async def close(self) -> None:
+        # Writes are never left buffered between updates
+        await self.flush()
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from config import (
+    WEBHOOK_CONCURRENCY, WEBHOOK_DRAIN_TIMEOUT, WEBHOOK_HOST, WEBHOOK_PATH,
+    WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrentRequestHandler(SimpleRequestHandler):
+    # Answers Telegram right away and processes the update in the background,
+    # with at most `concurrency` updates in flight. When all slots are busy the
+    # request waits, so Telegram slows down instead of tasks piling up in memory.
+    # The update tasks are tracked here, not in aiogram's background handling.
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int = 100,
+                 drain_timeout: float = 30, **kwargs):
+        super().__init__(dispatcher=dispatcher, bot=bot, **kwargs)
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self._draining = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._draining:
+            # Telegram retries the update later, another replica can take it
+            return web.Response(text="Shutting down", status=503)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.bot):
+            return web.Response(text="Unauthorized", status=401)
+
+        try:
+            update = await request.json(loads=self.bot.session.json_loads)
+        except ValueError:
+            return web.Response(text="Bad request", status=400)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._feed_update(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({})
+
+    async def _feed_update(self, update: dict):
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=self.bot, update=update, **self.data)
+            # The webhook response has gone out already, a method returned by a handler is called instead
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+        except Exception as e:
+            logger.exception(f"Failed to process update {update.get('update_id')}: {e}")
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        # Stop taking updates and let the ones in flight finish before closing the session
+        self._draining = True
+        tasks = set(self._tasks)
+        if tasks:
+            logger.info(f"Draining {len(tasks)} updates")
+            _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+            if pending:
+                logger.warning(f"{len(pending)} updates were still running after {self.drain_timeout}s")
+        await super().close()
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    app = web.Application()
+    ConcurrentRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        concurrency=WEBHOOK_CONCURRENCY,
+        drain_timeout=WEBHOOK_DRAIN_TIMEOUT,
+        secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, on_shutdown=None):
+    app = create_app(dp, bot)
+    if on_shutdown:
+        # Runs after the request handler has drained
+        app.on_shutdown.append(lambda _: on_shutdown())
+
+    # Without WEBHOOK_URL the server only listens, which is enough to post recorded updates locally
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_URL + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=min(WEBHOOK_CONCURRENCY, 100)
+        )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logger.info(f"Webhook server is listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows, KeyboardInterrupt still stops the server
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
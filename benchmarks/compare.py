@@ -0,0 +1,36 @@
+import argparse
+import json
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "queries")
+
+
+def change(old: float, new: float) -> str:
+    if not old:
+        return "" if not new else "new"
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark JSON files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    print(f"{'handler':<18}" + "".join(f"{metric:>24}" for metric in METRICS))
+    for name, new in candidate["handlers"].items():
+        old = baseline["handlers"].get(name)
+        if old is None:
+            print(f"{name:<18}{'(new)':>24}")
+            continue
+        cells = [f"{old[metric]:g} -> {new[metric]:g} {change(old[metric], new[metric])}" for metric in METRICS]
+        print(f"{name:<18}" + "".join(f"{cell:>24}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
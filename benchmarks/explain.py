@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date
+
+# Same throwaway database as benchmarks.handlers, set before config is imported
+WORKDIR = tempfile.mkdtemp(prefix="attendance-explain-")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite://{WORKDIR}/explain.sqlite3"
+os.environ["SCHEMA_MODE"] = "generate"
+
+from tortoise.transactions import in_transaction  # noqa: E402
+
+from app.db import fetch_all, get_connection  # noqa: E402
+from app.importer import ROSTER_SQL  # noqa: E402
+from app.models import Class, Grade, Lesson, Subject, User  # noqa: E402
+from app.queries import (  # noqa: E402
+    CLASS_RESULTS_SQL, ROSTER_STATUS_SQL, STUDENT_RESULTS_SQL, class_students, class_subjects
+)
+from app.reports import CLASS_GRADES_SQL, EXAM_RESULTS_SQL, STUDENT_DAYS_SQL  # noqa: E402
+from app.stats import ATTENDANCE_DAY_SQL, month_range  # noqa: E402
+from benchmarks.seed import seed_school  # noqa: E402
+from main import close_db, init_db  # noqa: E402
+
+# Hot queries with sample parameters, the plan doesn't depend on which ids are passed
+RAW_QUERIES = {
+    "roster_status": (ROSTER_STATUS_SQL, (date.today(), 1)),
+    "class_results": (CLASS_RESULTS_SQL, (1,)),
+    "student_results": (STUDENT_RESULTS_SQL, (2,)),
+    "exam_results": (EXAM_RESULTS_SQL, (1,)),
+    "class_grades": (CLASS_GRADES_SQL, (1,)),
+    "import_roster": (ROSTER_SQL, (1,)),
+    "student_days": (STUDENT_DAYS_SQL, (date.today().replace(day=1), 2)),
+    "attendance_day": (ATTENDANCE_DAY_SQL, (1, *month_range(date.today()), 1, date.today(), date.today(), 1)),
+}
+
+# Querysets as the handlers build them, given a seeded student
+ORM_QUERIES = {
+    "teacher_classes": lambda student: Class.filter(teacher_id=1),
+    "student_classes": lambda student: student.enrolled_classes.all(),
+    "class_students": lambda student: class_students(1),
+    "class_subjects": lambda student: class_subjects(1),
+    "class_lessons": lambda student: Lesson.filter(class_id_id=1),
+    "teacher_subjects": lambda student: Subject.filter(teacher_id=1),
+    "student_subject_grades": lambda student: Grade.filter(student_id=student.id, subject_id=1),
+}
+
+
+def parameterized(queryset) -> tuple:
+    # The statement and values the queryset sends; sql(params_inline=True) leaves subquery values out
+    queryset._choose_db_if_not_chosen()
+    queryset._make_query()
+    return queryset.query.get_parameterized_sql()
+
+
+async def sqlite_scans(sql: str, values) -> list:
+    # "SCAN t" is a full table scan, an index lookup reads "SEARCH t USING INDEX ..."
+    rows = await fetch_all(f"EXPLAIN QUERY PLAN {sql}", *values, connection=get_connection())
+    return [row["detail"] for row in rows if row["detail"].startswith("SCAN ")]
+
+
+def _seq_scans(node: dict):
+    if node.get("Node Type") == "Seq Scan":
+        yield f"Seq Scan on {node['Relation Name']}"
+    for child in node.get("Plans", ()):
+        yield from _seq_scans(child)
+
+
+async def postgres_scans(sql: str, values) -> list:
+    # With sequential scans priced out the planner takes any usable index,
+    # so a Seq Scan that remains means there is none
+    async with in_transaction("default") as connection:
+        await connection.execute_script("SET LOCAL enable_seqscan = off")
+        rows = await fetch_all(f"EXPLAIN (FORMAT JSON) {sql}", *values, connection=connection)
+    plan = rows[0]["QUERY PLAN"]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return list(_seq_scans(plan[0]["Plan"]))
+
+
+async def run(args) -> int:
+    await init_db()
+    try:
+        await seed_school(scale=args.scale, days=args.days)
+        # Planner statistics as a long running database would have them
+        await get_connection().execute_script("ANALYZE")
+        scans = sqlite_scans if get_connection().capabilities.dialect == "sqlite" else postgres_scans
+
+        student = await User.filter(is_student=True).first()
+        queries = dict(RAW_QUERIES)
+        for name, queryset in ORM_QUERIES.items():
+            queries[name] = parameterized(queryset(student))
+
+        failures = 0
+        for name, (sql, values) in queries.items():
+            found = await scans(sql, values)
+            print(f"{'FAIL' if found else 'ok':<6}{name}" + (f": {', '.join(found)}" if found else ""))
+            failures += bool(found)
+        return failures
+    finally:
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the hot queries are planned with indexes")
+    parser.add_argument("--scale", type=float, default=0.02, help="fraction of the full size school to seed")
+    parser.add_argument("--days", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        failures = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    if failures:
+        print(f"{failures} queries do a full scan", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
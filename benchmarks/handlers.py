@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict
+
+# Never touch the configured database: the suite seeds its own, a temporary SQLite file
+# unless BENCH_DATABASE_URL points at an empty database. Set before config is imported.
+WORKDIR = tempfile.mkdtemp(prefix="attendance-bench-")
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite://{WORKDIR}/bench.sqlite3"
+os.environ["SCHEMA_MODE"] = "generate"
+
+from aiogram import BaseMiddleware, Bot  # noqa: E402
+from aiogram.types import TelegramObject  # noqa: E402
+
+from app.metrics import _span, instrument_connections  # noqa: E402
+from app.storage import DatabaseStorage  # noqa: E402
+from benchmarks.seed import STUDENT_TELEGRAM_ID, TEACHER_TELEGRAM_ID, seed_school  # noqa: E402
+from benchmarks.stubs import StubSession, callback_update, message_update  # noqa: E402
+from main import close_db, create_dispatcher, init_db  # noqa: E402
+
+RESULTS = Path(__file__).parent / "results"
+
+
+class SpanRecorder(BaseMiddleware):
+    # Keeps the metrics span of the last update. Read once feed_update returns, its query
+    # count covers the whole update, the outer middlewares' queries included.
+    def __init__(self):
+        self.span = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        self.span = _span.get()
+        return await handler(event, data)
+
+
+class Bench:
+    def __init__(self, dp, bot):
+        self.dp = dp
+        self.bot = bot
+        self.spans = SpanRecorder()
+        dp.update.outer_middleware(self.spans)
+        self.recording = False
+        self.samples = {}  # handler -> [(seconds, queries)]
+
+    async def feed(self, name: str, update):
+        started = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        elapsed = time.perf_counter() - started
+        if self.recording:
+            self.samples.setdefault(name, []).append((elapsed, self.spans.span.queries))
+
+    def summary(self) -> dict:
+        result = {}
+        for name, samples in self.samples.items():
+            seconds = [sample[0] * 1000 for sample in samples]
+            queries = [sample[1] for sample in samples]
+            percentiles = statistics.quantiles(seconds, n=100, method="inclusive") if len(seconds) > 1 else seconds * 99
+            result[name] = {
+                "count": len(samples),
+                "p50_ms": round(percentiles[49], 3),
+                "p95_ms": round(percentiles[94], 3),
+                "p99_ms": round(percentiles[98], 3),
+                "mean_ms": round(statistics.fmean(seconds), 3),
+                "max_ms": round(max(seconds), 3),
+                "queries": round(statistics.fmean(queries), 2),
+                "max_queries": max(queries),
+            }
+        return result
+
+
+# Scenarios: one iteration replays what a user does in the bot
+
+async def mark_attendance(bench: Bench, school, rng: random.Random):
+    class_id, teacher_id = rng.choice(school.classes)
+    student_id = school.rosters[class_id][0]
+    telegram_id = TEACHER_TELEGRAM_ID + teacher_id
+    await bench.feed("attendance_open", callback_update(telegram_id, f"attendance_class:{class_id}"))
+    await bench.feed("attendance_mark", callback_update(telegram_id, f"roll_call:flip:{student_id}"))
+    await bench.feed("attendance_save", callback_update(telegram_id, "roll_call:save"))
+
+
+async def class_results(bench: Bench, school, rng: random.Random):
+    class_id, teacher_id = rng.choice(school.classes)
+    await bench.feed("class_results", callback_update(TEACHER_TELEGRAM_ID + teacher_id, f"class_results_{class_id}"))
+
+
+async def exam_results(bench: Bench, school, rng: random.Random):
+    _, telegram_id = rng.choice(school.teachers)
+    await bench.feed("exam_results", message_update(telegram_id, "📊 Imtihon natijalari"))
+
+
+async def join_class(bench: Bench, school, rng: random.Random):
+    _, telegram_id, member_of = rng.choice(school.students)
+    class_id = rng.choice([class_id for class_id, _ in school.classes if class_id != member_of] or [member_of])
+    await bench.feed("join_menu", message_update(telegram_id, "🏫 Sinfga a'zo bo'lish"))
+    await bench.feed("join_class", callback_update(telegram_id, f"join_class_{class_id}"))
+
+
+SCENARIOS = {
+    "attendance": mark_attendance,
+    "class_results": class_results,
+    "exam_results": exam_results,
+    "join_class": join_class,
+}
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run(args) -> dict:
+    await init_db()
+    started = time.perf_counter()
+    school = await seed_school(scale=args.scale, days=args.days, seed=args.seed)
+    seed_seconds = time.perf_counter() - started
+    print(f"Seeded {school.rows} in {seed_seconds:.1f} s", file=sys.stderr)
+
+    # Queries are counted by the metrics instrumentation, which the query log hooks into too:
+    # a run fails on a handler over its budget
+    instrument_connections()
+    storage = DatabaseStorage()
+    bot = Bot(token="42:BENCHMARK", session=StubSession())
+    dp = create_dispatcher(storage, throttling=False, query_budgets=not args.no_budgets)
+    bench = Bench(dp, bot)
+    rng = random.Random(args.seed)
+
+    scenarios = args.scenario or list(SCENARIOS)
+    try:
+        for name in scenarios:
+            bench.recording = False
+            for _ in range(args.warmup):
+                await SCENARIOS[name](bench, school, rng)
+            bench.recording = True
+            for _ in range(args.iterations):
+                await SCENARIOS[name](bench, school, rng)
+    finally:
+        await storage.close()
+        await close_db()
+
+    return {
+        "commit": current_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        "scale": args.scale,
+        "days": args.days,
+        "iterations": args.iterations,
+        "seed": {"seconds": round(seed_seconds, 2), "rows": school.rows},
+        "handlers": bench.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay handler hot paths through Dispatcher.feed_update")
+    parser.add_argument("--scale", type=float, default=1.0, help="fraction of the full size school")
+    parser.add_argument("--days", type=int, default=190, help="school days of attendance history")
+    parser.add_argument("--iterations", type=int, default=200, help="measured iterations per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="run only these, repeatable")
+    parser.add_argument("--no-budgets", action="store_true", help="don't fail on query budgets and N+1 queries")
+    parser.add_argument("--output", help="JSON file, default benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    output = Path(args.output) if args.output else RESULTS / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    print(f"{'handler':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}")
+    for name, stats in report["handlers"].items():
+        print(f"{name:<18}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['queries']:>10.1f}")
+    print(f"Written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+
+from app.db import get_connection, prepare
+from app.stats import rebuild_attendance_monthly, rebuild_grade_stats
+
+# Full size school: 500 teachers, 1,500 classes, 40k students. --scale shrinks every count.
+TEACHERS = 500
+CLASSES_PER_TEACHER = 3
+STUDENTS = 40_000
+EXAMS_PER_SUBJECT = 6
+GRADES_PER_STUDENT = 24
+PRESENT_RATE = 0.93
+
+TEACHER_TELEGRAM_ID = 1_000_000
+STUDENT_TELEGRAM_ID = 2_000_000
+
+# Rows sent per executemany call
+CHUNK = 20_000
+
+
+@dataclass
+class School:
+    teachers: list = field(default_factory=list)  # (users.id, telegram id)
+    students: list = field(default_factory=list)  # (users.id, telegram id, class id)
+    classes: list = field(default_factory=list)  # (classes.id, teacher users.id)
+    rosters: dict = field(default_factory=dict)  # classes.id -> student users.id
+    rows: dict = field(default_factory=dict)  # table -> inserted rows
+
+
+async def insert_many(table: str, columns: tuple, rows):
+    # Streams rows in chunks, each chunk is one executemany call
+    connection = get_connection()
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+    sql, _ = prepare(connection, sql, columns)
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(prepare(connection, "", row)[1])
+        if len(chunk) == CHUNK:
+            await connection.execute_many(sql, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        await connection.execute_many(sql, chunk)
+        count += len(chunk)
+    return count
+
+
+def school_days(days: int, today: date):
+    # The last `days` weekdays before today, oldest first
+    result = []
+    day = today - timedelta(days=1)
+    while len(result) < days:
+        if day.weekday() < 5:
+            result.append(day)
+        day -= timedelta(days=1)
+    return result[::-1]
+
+
+async def seed_school(scale: float = 1.0, days: int = 190, seed: int = 1) -> School:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    teachers = max(1, round(TEACHERS * scale))
+    classes = teachers * CLASSES_PER_TEACHER
+    students = max(classes, round(STUDENTS * scale))
+    school = School()
+
+    # Explicit ids keep the seed to plain inserts, nothing is read back
+    school.teachers = [(number, TEACHER_TELEGRAM_ID + number) for number in range(1, teachers + 1)]
+    school.classes = [(number, (number - 1) % teachers + 1) for number in range(1, classes + 1)]
+    school.students = [
+        (teachers + number, STUDENT_TELEGRAM_ID + number, (number - 1) % classes + 1)
+        for number in range(1, students + 1)
+    ]
+
+    columns = ("id", "user_id", "full_name", "is_student", "is_teacher", "created_at")
+    school.rows["users"] = await insert_many("users", columns, [
+        *((user_id, telegram_id, f"Teacher {user_id}", False, True, now) for user_id, telegram_id in school.teachers),
+        *((user_id, telegram_id, f"Student {user_id}", True, False, now) for user_id, telegram_id, _ in school.students),
+    ])
+    school.rows["classes"] = await insert_many("classes", ("id", "name", "teacher_id", "created_at"), (
+        (class_id, f"{class_id}-sinf", teacher_id, now) for class_id, teacher_id in school.classes
+    ))
+    school.rows["classes_users"] = await insert_many("classes_users", ("classes_id", "user_id"), (
+        (class_id, user_id) for user_id, _, class_id in school.students
+    ))
+
+    # One subject per teacher, subjects.id == teacher id
+    school.rows["subjects"] = await insert_many("subjects", ("id", "title", "teacher_id", "created_at"), (
+        (teacher_id, f"Fan {teacher_id}", teacher_id, now) for teacher_id, _ in school.teachers
+    ))
+    school.rows["exams"] = await insert_many("exams", ("id", "title", "subject_id", "teacher_id", "created_at"), (
+        ((teacher_id - 1) * EXAMS_PER_SUBJECT + number, f"Imtihon {number}", teacher_id, teacher_id, now)
+        for teacher_id, _ in school.teachers
+        for number in range(1, EXAMS_PER_SUBJECT + 1)
+    ))
+
+    teacher_of = dict(school.classes)
+    for user_id, _, class_id in school.students:
+        school.rosters.setdefault(class_id, []).append(user_id)
+
+    def grades():
+        for user_id, _, class_id in school.students:
+            subject_id = teacher_of[class_id]
+            for number in range(1, EXAMS_PER_SUBJECT + 1):
+                exam_id = (subject_id - 1) * EXAMS_PER_SUBJECT + number
+                yield user_id, subject_id, exam_id, rng.randint(40, 100), now
+            for _ in range(GRADES_PER_STUDENT):
+                yield user_id, subject_id, None, rng.randint(2, 5), now
+
+    school.rows["grades"] = await insert_many(
+        "grades", ("student_id", "subject_id", "exam_id", "value", "created_at"), grades()
+    )
+
+    calendar = school_days(days, date.today())
+
+    def attendances():
+        for class_id, members in school.rosters.items():
+            for day in calendar:
+                for user_id in members:
+                    yield user_id, class_id, day, rng.random() < PRESENT_RATE, now
+
+    school.rows["attendances"] = await insert_many(
+        "attendances", ("user_id", "class_id_id", "day", "is_present", "marked_at"), attendances()
+    )
+
+    # Rollups are built the same way a backfill after a migration would; like add_grade,
+    # the rebuild leaves the exam scores out of grade_stats
+    school.rows["grade_stats"] = await rebuild_grade_stats()
+    school.rows["attendance_monthly"] = await rebuild_attendance_monthly()
+    return school
@@ -0,0 +1,67 @@
+import itertools
+import time
+
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageText, SendDocument, SendMessage
+from aiogram.types import Message, Update
+
+_ids = itertools.count(1)
+
+
+class StubSession(BaseSession):
+    # Answers every Bot API call locally, so only the bot's own work is measured
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if isinstance(method, (SendMessage, SendDocument, EditMessageText)):
+            return Message.model_validate({
+                "message_id": next(_ids),
+                "date": int(time.time()),
+                "chat": {"id": getattr(method, "chat_id", None) or 1, "type": "private"},
+                "text": getattr(method, "text", None) or "",
+            })
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def _user(telegram_id: int) -> dict:
+    return {"id": telegram_id, "is_bot": False, "first_name": "Bench"}
+
+
+def message_update(telegram_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": next(_ids),
+        "message": {
+            "message_id": next(_ids),
+            "date": int(time.time()),
+            "chat": {"id": telegram_id, "type": "private"},
+            "from": _user(telegram_id),
+            "text": text,
+        },
+    })
+
+
+def callback_update(telegram_id: int, data: str) -> Update:
+    return Update.model_validate({
+        "update_id": next(_ids),
+        "callback_query": {
+            "id": str(next(_ids)),
+            "chat_instance": "bench",
+            "from": _user(telegram_id),
+            "data": data,
+            "message": {
+                "message_id": next(_ids),
+                "date": int(time.time()),
+                "chat": {"id": telegram_id, "type": "private"},
+                "text": "bench",
+            },
+        },
+    })
@@ -1,19 +1,114 @@
+import time
+
+# Measured from here: the import time of aiogram and the handler tree is part of every restart
+STARTED = time.perf_counter()
+
 import asyncio
+import importlib
 import logging
+from pathlib import Path
+
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import GetUpdates
 from tortoise import Tortoise
+from tortoise.exceptions import OperationalError
+
+from app.db import fetch_all, get_connection
+from app.metrics import HandlerNameMiddleware, MetricsMiddleware, instrument_connections, start_metrics_server
+from app.middlewares import FSMFlushMiddleware, RegisteredMiddleware, ThrottlingMiddleware, UserMiddleware
+from app.models import M2M_INDEXES
+from app.outbox import outbox
+from app.querylog import QueryLogMiddleware
+from app.sqlite_schema import prepare_sqlite_schema
+from app.storage import DatabaseStorage
+from app.webhook import run_webhook
+from config import BOT_MODE, BOT_TOKEN, METRICS_HOST, METRICS_PORT, SCHEMA_MODE, TORTOISE_ORM
+
+# Routers in the order the dispatcher tries them, imported when the dispatcher is built
+# (the other modules in app/handlers are earlier drafts of these screens and are not registered)
+ROUTERS = [
+    "app.handlers.user",        # menu handlers
+    "app.handlers.attendance",  # roll call callbacks
+    "app.handlers.exam",        # exam flow and its paginated results
+    "app.handlers.pagination",  # page turning for every list keyboard and report
+]
+
+MIGRATIONS = Path(__file__).parent / "migrations" / "models"
+
+
+def include_routers(dp: Dispatcher):
+    for path in ROUTERS:
+        dp.include_router(importlib.import_module(path).router)
+
+
+def create_dispatcher(storage, throttling: bool = True, query_budgets: bool = False) -> Dispatcher:
+    # Shared by main() and the benchmarks, which turn throttling off to replay many updates per user
+    # and turn query_budgets on to fail on handlers over their query budget or with N+1 queries
+    # aiogram registers its FSM middleware, which reads the chat's state, in the constructor.
+    # It is added back after MetricsMiddleware, so the state read is measured with the update.
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    # Outermost, so the user lookup and the FSM reads and flush count towards the handler
+    dp.update.outer_middleware(MetricsMiddleware())
+    dp.update.outer_middleware(dp.fsm)
+    dp.update.outer_middleware(FSMFlushMiddleware(storage))
+    dp.update.outer_middleware(UserMiddleware())
+    if throttling:
+        # One instance for both event types so a user's budget is shared
+        middleware = ThrottlingMiddleware()
+        dp.message.middleware(middleware)
+        dp.callback_query.middleware(middleware)
+    handler_names = HandlerNameMiddleware()
+    registered = RegisteredMiddleware()
+    query_log = QueryLogMiddleware() if query_budgets else None
+    for event_name, observer in dp.observers.items():
+        if event_name not in ("update", "error"):
+            observer.middleware(handler_names)
+            observer.middleware(registered)
+            if query_log:
+                observer.middleware(query_log)
+    include_routers(dp)
+    return dp
+
+
+def latest_migration() -> str:
+    # aerich records the file name of the last applied migration
+    return max((path.name for path in MIGRATIONS.glob("[0-9]*_*.py")), key=migration_number)
+
+
+def migration_number(name: str) -> int:
+    # Every model change comes with a migration, so its number versions the SQLite schema too
+    return int(name.split("_")[0])
+
+
+async def verify_schema():
+    # One indexed query instead of introspection and DDL on every boot
+    expected = latest_migration()
+    try:
+        rows = await fetch_all(
+            "SELECT version FROM aerich WHERE app = ? ORDER BY id DESC LIMIT 1", "models",
+            connection=get_connection()
+        )
+    except OperationalError:
+        rows = []
+    current = rows[0]["version"] if rows else None
+    if current != expected:
+        raise RuntimeError(f"Database schema is at {current}, expected {expected}: run `aerich upgrade`")
 
-from app.handlers.user import router as user_router
-from config import BOT_TOKEN, TORTOISE_ORM
 
 async def init_db():
-    await Tortoise.init(
-        db_url=TORTOISE_ORM["connections"]["default"],
-        modules={'models': ['app.models']}
-    )
-    
-    await Tortoise.generate_schemas(safe=True)
+    # Connection and pool settings come from the environment, see config.py
+    await Tortoise.init(config=TORTOISE_ORM)
+
+    if SCHEMA_MODE != "generate":
+        await verify_schema()
+    elif get_connection().capabilities.dialect == "sqlite":
+        # One PRAGMA read when the schema is current, tables of an older version are upgraded
+        # in place, see app/sqlite_schema.py
+        await prepare_sqlite_schema(migration_number(latest_migration()))
+    else:
+        await Tortoise.generate_schemas(safe=True)
+        for sql in M2M_INDEXES:
+            await get_connection().execute_script(sql)
 
 async def close_db  ():
     await Tortoise.close_connections()
@@ -24,19 +119,62 @@ async def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
 
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    timings = {"imports": time.perf_counter() - STARTED}
 
-    # Include only the user router as it contains all handlers
-    dp.include_router(user_router)
+    bot = Bot(token=BOT_TOKEN)
+    # FSM state lives in the database, so flows survive restarts and deploys.
+    # Behind a load balancer a chat's next update may reach another replica,
+    # so webhook replicas read the state from the database every time.
+    storage = DatabaseStorage(cache_ttl=0 if BOT_MODE == "webhook" else 5)
+    started = time.perf_counter()
+    dp = create_dispatcher(storage)
+    timings["routers"] = time.perf_counter() - started
 
+    started = time.perf_counter()
     await init_db()
+    timings["database"] = time.perf_counter() - started
+    # Per handler latency, DB time and query count, served for Prometheus
+    instrument_connections()
+    metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+    # Notifications to other users are sent in the background within Telegram's limits
+    outbox.start(bot)
+
+    async def shutdown():
+        await outbox.close()
+        # The session is reopened if the outbox still had messages to send
+        await bot.session.close()
+        await storage.close()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await close_db()
+
+    if BOT_MODE == "webhook":
+        log_startup(timings)
+        # The server drains in-flight updates on SIGTERM before shutdown() runs
+        await run_webhook(dp, bot, on_shutdown=shutdown)
+        return
+
+    # The bot is back online once the first getUpdates request goes out
+    started = time.perf_counter()
+
+    async def first_poll(make_request, bot, method):
+        if isinstance(method, GetUpdates) and "first poll" not in timings:
+            timings["first poll"] = time.perf_counter() - started
+            log_startup(timings)
+        return await make_request(bot, method)
+
+    bot.session.middleware(first_poll)
+
     try:
         await dp.start_polling(bot)
     except Exception as e:
         logging.error(f"Error in main: {e}")
     finally:
-        await close_db()
+        await shutdown()
+
+def log_startup(timings: dict):
+    breakdown = ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in timings.items())
+    logging.info("Startup: %s, total %.0f ms", breakdown, (time.perf_counter() - STARTED) * 1000)
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,30 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "attendances" RENAME COLUMN "student_id" TO "user_id";
+ALTER TABLE "attendances" DROP CONSTRAINT IF EXISTS "uid_attendances_student_12d3dc";
+ALTER TABLE "attendances" ADD "day" DATE;
+ALTER TABLE "attendances" ADD "marked_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP;
+UPDATE "attendances" SET "day" = CAST("date" AS DATE), "marked_at" = "date";
+DELETE FROM "attendances" AS "a" USING "attendances" AS "b"
+    WHERE "a"."class_id_id" = "b"."class_id_id"
+    AND "a"."user_id" = "b"."user_id"
+    AND "a"."day" = "b"."day"
+    AND "a"."id" < "b"."id";
+ALTER TABLE "attendances" ALTER COLUMN "day" SET NOT NULL;
+ALTER TABLE "attendances" DROP COLUMN "date";
+COMMENT ON COLUMN "attendances"."day" IS 'Attendance day';
+ALTER TABLE "attendances" ADD CONSTRAINT "uid_attendances_class_i_d2b4e6" UNIQUE ("class_id_id", "day", "user_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "attendances" DROP CONSTRAINT IF EXISTS "uid_attendances_class_i_d2b4e6";
+ALTER TABLE "attendances" ADD "date" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP;
+UPDATE "attendances" SET "date" = "marked_at";
+ALTER TABLE "attendances" DROP COLUMN "marked_at";
+ALTER TABLE "attendances" DROP COLUMN "day";
+ALTER TABLE "attendances" RENAME COLUMN "user_id" TO "student_id";
+ALTER TABLE "attendances" ADD CONSTRAINT "uid_attendances_student_12d3dc" UNIQUE ("student_id", "class_id_id", "date");"""
@@ -0,0 +1,18 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "fsm_states" (
+    "key" VARCHAR(255) NOT NULL  PRIMARY KEY,
+    "state" VARCHAR(255),
+    "data" TEXT NOT NULL  DEFAULT '{}',
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP
+);
+COMMENT ON COLUMN "fsm_states"."data" IS 'JSON encoded FSM data';
+CREATE INDEX IF NOT EXISTS "idx_fsm_states_updated_12b2d7" ON "fsm_states" ("updated_at");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "fsm_states";"""
@@ -0,0 +1,30 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "grade_stats" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "grade_count" INT NOT NULL  DEFAULT 0,
+    "total" INT NOT NULL  DEFAULT 0,
+    "min_value" INT NOT NULL,
+    "max_value" INT NOT NULL,
+    "last_value" INT NOT NULL,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "student_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE,
+    "subject_id" INT NOT NULL REFERENCES "subjects" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_grade_stats_student_769764" UNIQUE ("student_id", "subject_id")
+);
+COMMENT ON COLUMN "grade_stats"."total" IS 'sum of values';
+INSERT INTO "grade_stats" ("student_id", "subject_id", "grade_count", "total", "min_value", "max_value", "last_value")
+SELECT "g"."student_id", "g"."subject_id", COUNT(*), SUM("g"."value"), MIN("g"."value"), MAX("g"."value"),
+    (SELECT "l"."value" FROM "grades" AS "l"
+     WHERE "l"."student_id" = "g"."student_id" AND "l"."subject_id" = "g"."subject_id"
+     ORDER BY "l"."created_at" DESC, "l"."id" DESC LIMIT 1)
+FROM "grades" AS "g"
+GROUP BY "g"."student_id", "g"."subject_id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "grade_stats";"""
@@ -0,0 +1,40 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "attendance_monthly" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "month" DATE NOT NULL,
+    "present" INT NOT NULL  DEFAULT 0,
+    "absent" INT NOT NULL  DEFAULT 0,
+    "unmarked" INT NOT NULL  DEFAULT 0,
+    "updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+    "class_id_id" INT NOT NULL REFERENCES "classes" ("id") ON DELETE CASCADE,
+    "user_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_attendance__user_id_f8ee15" UNIQUE ("user_id", "class_id_id", "month")
+);
+COMMENT ON COLUMN "attendance_monthly"."month" IS 'First day of the month';
+COMMENT ON COLUMN "attendance_monthly"."unmarked" IS 'days the class was marked but this student was not';
+WITH "held" AS (
+    SELECT "class_id_id", CAST(DATE_TRUNC('month', "day") AS DATE) AS "month", COUNT(DISTINCT "day") AS "days"
+    FROM "attendances"
+    GROUP BY 1, 2
+)
+INSERT INTO "attendance_monthly" ("user_id", "class_id_id", "month", "present", "absent", "unmarked")
+SELECT "cu"."user_id", "held"."class_id_id", "held"."month",
+    SUM(CASE WHEN "a"."is_present" THEN 1 ELSE 0 END),
+    SUM(CASE WHEN NOT "a"."is_present" THEN 1 ELSE 0 END),
+    "held"."days" - COUNT("a"."id")
+FROM "held"
+JOIN "classes_users" AS "cu" ON "cu"."classes_id" = "held"."class_id_id"
+LEFT JOIN "attendances" AS "a"
+    ON "a"."user_id" = "cu"."user_id"
+    AND "a"."class_id_id" = "held"."class_id_id"
+    AND DATE_TRUNC('month', "a"."day") = "held"."month"
+GROUP BY "cu"."user_id", "held"."class_id_id", "held"."month", "held"."days";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "attendance_monthly";"""
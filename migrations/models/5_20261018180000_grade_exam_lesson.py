@@ -0,0 +1,17 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "grades" ADD "exam_id" INT;
+ALTER TABLE "grades" ADD "lesson_id" INT;
+ALTER TABLE "grades" ADD CONSTRAINT "fk_grades_exams_5b2f0c41" FOREIGN KEY ("exam_id") REFERENCES "exams" ("id") ON DELETE CASCADE;
+ALTER TABLE "grades" ADD CONSTRAINT "fk_grades_lessons_8e1d7a93" FOREIGN KEY ("lesson_id") REFERENCES "lessons" ("id") ON DELETE CASCADE;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "grades" DROP CONSTRAINT IF EXISTS "fk_grades_lessons_8e1d7a93";
+ALTER TABLE "grades" DROP CONSTRAINT IF EXISTS "fk_grades_exams_5b2f0c41";
+ALTER TABLE "grades" DROP COLUMN "lesson_id";
+ALTER TABLE "grades" DROP COLUMN "exam_id";"""
@@ -0,0 +1,15 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "users" ALTER COLUMN "user_id" DROP NOT NULL;
+ALTER TABLE "users" ADD "invite_code" VARCHAR(16) UNIQUE;
+COMMENT ON COLUMN "users"."invite_code" IS 'Roster invite code';"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DELETE FROM "users" WHERE "user_id" IS NULL;
+ALTER TABLE "users" DROP COLUMN "invite_code";
+ALTER TABLE "users" ALTER COLUMN "user_id" SET NOT NULL;"""
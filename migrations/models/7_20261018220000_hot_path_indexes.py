@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DELETE FROM "classes_users" AS "a" USING "classes_users" AS "b"
+    WHERE "a"."ctid" < "b"."ctid" AND "a"."classes_id" = "b"."classes_id" AND "a"."user_id" = "b"."user_id";
+CREATE UNIQUE INDEX IF NOT EXISTS "uidx_classes_use_classes_e21c3f" ON "classes_users" ("classes_id", "user_id");
+CREATE INDEX IF NOT EXISTS "idx_classes_use_user_id_9d33e6" ON "classes_users" ("user_id", "classes_id");
+CREATE INDEX IF NOT EXISTS "idx_classes_teacher_d6710a" ON "classes" ("teacher_id");
+CREATE INDEX IF NOT EXISTS "idx_subjects_teacher_6af1fd" ON "subjects" ("teacher_id");
+CREATE INDEX IF NOT EXISTS "idx_exams_subject_b96601" ON "exams" ("subject_id");
+CREATE INDEX IF NOT EXISTS "idx_lessons_class_i_840867" ON "lessons" ("class_id_id");
+CREATE INDEX IF NOT EXISTS "idx_grades_student_bc930b" ON "grades" ("student_id", "subject_id");
+CREATE INDEX IF NOT EXISTS "idx_grades_exam_id_cea356" ON "grades" ("exam_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_grades_exam_id_cea356";
+DROP INDEX IF EXISTS "idx_grades_student_bc930b";
+DROP INDEX IF EXISTS "idx_lessons_class_i_840867";
+DROP INDEX IF EXISTS "idx_exams_subject_b96601";
+DROP INDEX IF EXISTS "idx_subjects_teacher_6af1fd";
+DROP INDEX IF EXISTS "idx_classes_teacher_d6710a";
+DROP INDEX IF EXISTS "idx_classes_use_user_id_9d33e6";
+DROP INDEX IF EXISTS "uidx_classes_use_classes_e21c3f";"""
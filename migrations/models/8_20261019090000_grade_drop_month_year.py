@@ -0,0 +1,16 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "grades" DROP COLUMN "month";
+ALTER TABLE "grades" DROP COLUMN "year";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "grades" ADD "month" INT;
+ALTER TABLE "grades" ADD "year" INT;
+UPDATE "grades" SET "month" = EXTRACT(MONTH FROM "created_at"), "year" = EXTRACT(YEAR FROM "created_at");
+ALTER TABLE "grades" ALTER COLUMN "month" SET NOT NULL;
+ALTER TABLE "grades" ALTER COLUMN "year" SET NOT NULL;"""
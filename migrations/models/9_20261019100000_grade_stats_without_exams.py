@@ -0,0 +1,32 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DELETE FROM "grade_stats";
+INSERT INTO "grade_stats" ("student_id", "subject_id", "grade_count", "total", "min_value", "max_value", "last_value")
+SELECT "student_id", "subject_id", COUNT(*), SUM("value"), MIN("value"), MAX("value"), MAX("last_value")
+FROM (
+    SELECT "student_id", "subject_id", "value",
+        FIRST_VALUE("value") OVER (
+            PARTITION BY "student_id", "subject_id" ORDER BY "created_at" DESC, "id" DESC
+        ) AS "last_value"
+    FROM "grades"
+    WHERE "exam_id" IS NULL
+) AS "ranked"
+GROUP BY "student_id", "subject_id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DELETE FROM "grade_stats";
+INSERT INTO "grade_stats" ("student_id", "subject_id", "grade_count", "total", "min_value", "max_value", "last_value")
+SELECT "student_id", "subject_id", COUNT(*), SUM("value"), MIN("value"), MAX("value"), MAX("last_value")
+FROM (
+    SELECT "student_id", "subject_id", "value",
+        FIRST_VALUE("value") OVER (
+            PARTITION BY "student_id", "subject_id" ORDER BY "created_at" DESC, "id" DESC
+        ) AS "last_value"
+    FROM "grades"
+) AS "ranked"
+GROUP BY "student_id", "subject_id";"""
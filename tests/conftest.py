@@ -0,0 +1,21 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The tests run on a private in-memory database; set before config is imported
+os.environ["DATABASE_URL"] = "sqlite://:memory:"
+os.environ["SCHEMA_MODE"] = "generate"
+os.environ["METRICS_PORT"] = "0"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def dispatcher():
+    # The routers are module level and can only be attached to one dispatcher per process
+    from app.storage import DatabaseStorage
+    from main import create_dispatcher
+
+    return create_dispatcher(DatabaseStorage(), throttling=False, query_budgets=True)
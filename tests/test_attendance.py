@@ -0,0 +1,35 @@
+import asyncio
+
+
+def test_lesson_marks_write_present_and_absent(dispatcher):
+    from aiogram import Bot
+
+    from app.models import Attendance, Class, Lesson, Subject, User
+    from benchmarks.stubs import StubSession, callback_update
+    from main import close_db, init_db
+
+    async def run():
+        await init_db()
+        try:
+            teacher = await User.create(user_id=100, full_name="Teacher", is_teacher=True)
+            student = await User.create(user_id=200, full_name="Student", is_student=True)
+            class_obj = await Class.create(name="5A", teacher=teacher)
+            await class_obj.students.add(student)
+            subject = await Subject.create(title="Math", teacher=teacher)
+            lesson = await Lesson.create(title="Algebra", description="", class_id=class_obj, subject=subject, teacher=teacher)
+
+            bot = Bot(token="42:TEST", session=StubSession())
+            marks = []
+            for action in ("student_present", "student_absent"):
+                await dispatcher.feed_update(bot, callback_update(teacher.user_id, f"{action}:{student.id}:{lesson.id}"))
+                marks.append(await Attendance.filter(user=student).values_list("is_present", flat=True))
+            await dispatcher.storage.close()
+            month = await class_obj.attendance_months.filter(user=student).get()
+            return marks, (month.present, month.absent)
+        finally:
+            await close_db()
+
+    marks, month = asyncio.run(run())
+    # The second tap overwrites today's mark, in the monthly rollup too
+    assert marks == [[True], [False]]
+    assert month == (0, 1)
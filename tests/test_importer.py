@@ -0,0 +1,31 @@
+import zipfile
+
+import pytest
+
+from app.importer import read_xlsx
+
+
+def _workbook(path, files: dict):
+    with zipfile.ZipFile(path, "w") as workbook:
+        for name, content in files.items():
+            workbook.writestr(name, content)
+    return str(path)
+
+
+def test_xlsx_without_worksheets_is_a_bad_file(tmp_path):
+    path = _workbook(tmp_path / "empty.xlsx", {"[Content_Types].xml": "<Types/>"})
+    with pytest.raises(ValueError):
+        list(read_xlsx(path))
+
+
+def test_xlsx_rows_are_read(tmp_path):
+    sheet = (
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="inlineStr"><is><t>42</t></is></c></row>'
+        '</sheetData></worksheet>'
+    )
+    strings = (
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><si><t>Ali Valiyev</t></si></sst>'
+    )
+    path = _workbook(tmp_path / "roster.xlsx", {"xl/worksheets/sheet1.xml": sheet, "xl/sharedStrings.xml": strings})
+    assert list(read_xlsx(path)) == [["Ali Valiyev", "", "42"]]
@@ -0,0 +1,51 @@
+import asyncio
+
+from benchmarks.stubs import StubSession
+
+
+class RecordingSession(StubSession):
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    async def make_request(self, bot, method, timeout=None):
+        if getattr(method, "text", None):
+            self.texts.append(method.text)
+        return await super().make_request(bot, method, timeout)
+
+
+def test_unregistered_users_are_refused_and_not_cached(dispatcher):
+    from aiogram import Bot
+
+    from app.middlewares import user_cache
+    from app.models import User
+    from benchmarks.stubs import message_update
+    from main import close_db, init_db
+
+    async def run():
+        await init_db()
+        try:
+            session = RecordingSession()
+            bot = Bot(token="42:TEST", session=session)
+
+            # A handler that takes `user` is not reached without one
+            await dispatcher.feed_update(bot, message_update(300, "📊 Natijalar"))
+            refused = session.texts[-1]
+            # /start serves unregistered users
+            await dispatcher.feed_update(bot, message_update(300, "/start"))
+            welcome = session.texts[-1]
+
+            # Registered elsewhere, e.g. on another webhook replica
+            await User.create(user_id=300, full_name="Student", is_student=True)
+            await dispatcher.feed_update(bot, message_update(300, "📊 Natijalar"))
+            await dispatcher.storage.close()
+            return refused, welcome, session.texts[-1], user_cache.get(300)
+        finally:
+            user_cache.clear()
+            await close_db()
+
+    refused, welcome, results, cached = asyncio.run(run())
+    assert refused == "⚠️ Avval ro'yxatdan o'ting: /start"
+    assert welcome.startswith("Botga xush kelibsiz!")
+    assert results != refused
+    assert cached.user_id == 300
@@ -0,0 +1,72 @@
+import asyncio
+
+from app.pagination import Picker
+
+
+class Row:
+    def __init__(self, id):
+        self.id = id
+
+
+def test_cached_pages_match_cursors():
+    rows = [Row(id) for id in (2, 3, 5, 7, 11)]
+
+    async def load():
+        return rows
+
+    picker = Picker("testrows", load, lambda row: (str(row.id), str(row.id)), page_size=2, cached=True)
+
+    async def pages():
+        first = await picker.fetch()
+        second = await picker.fetch(after=3)
+        back = await picker.fetch(before=5)
+        last = await picker.fetch(after=7)
+        return first, second, back, last
+
+    first, second, back, last = asyncio.run(pages())
+    assert ([row.id for row in first[0]], first[1:]) == ([2, 3], (False, True))
+    assert ([row.id for row in second[0]], second[1:]) == ([5, 7], (True, True))
+    assert ([row.id for row in back[0]], back[1:]) == ([2, 3], (False, True))
+    assert ([row.id for row in last[0]], last[1:]) == ([11], (True, False))
+
+
+def test_cached_lists_are_invalidated():
+    from app.models import Class, Subject, User
+    from app.queries import enroll_student, get_class_roster, get_class_subjects, get_teacher_classes, query_cache
+    from main import close_db, init_db
+
+    async def run():
+        await init_db()
+        try:
+            teacher = await User.create(user_id=100, full_name="Teacher", is_teacher=True)
+            student = await User.create(user_id=200, full_name="Student", is_student=True)
+            class_obj = await Class.create(name="5A", teacher=teacher)
+            # Loaded once, so the later reads come from the cache unless invalidated
+            assert [row.id for row in await get_teacher_classes(teacher.id)] == [class_obj.id]
+            assert await get_class_roster(class_obj.id) == []
+            assert await get_class_subjects(class_obj.id) == []
+
+            other = await Class.create(name="5B", teacher=teacher)
+            await enroll_student(class_obj, student)
+            subject = await Subject.create(title="Math", teacher=teacher)
+            classes = [row.id for row in await get_teacher_classes(teacher.id)]
+            roster = [row.id for row in await get_class_roster(class_obj.id)]
+            subjects = [row.id for row in await get_class_subjects(class_obj.id)]
+
+            await other.delete()
+            await subject.delete()
+            after_delete = (
+                [row.id for row in await get_teacher_classes(teacher.id)],
+                await get_class_subjects(class_obj.id),
+            )
+            return (classes, roster, subjects, after_delete), (class_obj.id, other.id, student.id, subject.id)
+        finally:
+            # The next test starts on a new database with the same ids
+            query_cache.clear()
+            await close_db()
+
+    (classes, roster, subjects, after_delete), (class_id, other_id, student_id, subject_id) = asyncio.run(run())
+    assert classes == [class_id, other_id]
+    assert roster == [student_id]
+    assert subjects == [subject_id]
+    assert after_delete == ([class_id], [])
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from app.querylog import REPEAT_LIMIT, QueryBudgetExceeded, check, normalize
+
+
+def test_normalize_ignores_parameters():
+    assert normalize("SELECT * FROM users WHERE id = 5") == normalize("SELECT * FROM users WHERE id = 17")
+    assert normalize("SELECT * FROM users WHERE name = 'Ali'") == "SELECT * FROM users WHERE name = ?"
+    assert normalize('SELECT "a" FROM "t" WHERE "id"=$1') == 'SELECT "a" FROM "t" WHERE "id"=?'
+    assert normalize("SELECT 1 FROM t WHERE id IN (?, ?, ?)") == normalize("SELECT 1 FROM t WHERE id IN (?)")
+    assert normalize("SELECT  *\n  FROM t") == "SELECT * FROM t"
+
+
+def test_normalize_keeps_different_statements_apart():
+    assert normalize("SELECT * FROM users WHERE id = 1") != normalize("SELECT * FROM classes WHERE id = 1")
+
+
+def test_check_within_budget():
+    check("handler", ["SELECT 1 FROM users", "SELECT 1 FROM classes"], budget=2)
+    check("handler", ["SELECT 1 FROM users"] * (REPEAT_LIMIT - 1))
+
+
+def test_check_over_budget():
+    with pytest.raises(QueryBudgetExceeded) as info:
+        check("user.handler", ["SELECT 1 FROM users", "SELECT 1 FROM classes"], budget=1)
+    assert info.value.handler == "user.handler"
+    assert info.value.problems == ["2 queries, budget is 1"]
+
+
+def test_check_repeated_statement():
+    # The same lookup with a different id per row is an N+1, budget or not
+    statements = [f"SELECT * FROM users WHERE id = {number}" for number in range(REPEAT_LIMIT)]
+    with pytest.raises(QueryBudgetExceeded) as info:
+        check("user.handler", statements)
+    assert info.value.problems == [f"N+1: the same statement ran {REPEAT_LIMIT} times"]
+    assert f"{REPEAT_LIMIT}x SELECT * FROM users WHERE id = ?" in str(info.value)
+
+
+def _handler(router, callback):
+    for observer in router.observers.values():
+        for handler in observer.handlers:
+            if handler.callback is callback:
+                return handler
+    raise LookupError(callback)
+
+
+def test_roll_call_query_budget(dispatcher):
+    from aiogram import Bot
+
+    from app.handlers import attendance
+    from app.metrics import instrument_connections
+    from app.models import Class, User
+    from benchmarks.stubs import StubSession, callback_update
+    from main import close_db, init_db
+
+    assert _handler(attendance.router, attendance.show_students_for_attendance).flags["query_budget"] == 2
+    # Saving reads the day, writes the marks and adds them to the monthly rollup
+    assert _handler(attendance.router, attendance.process_roll_call).flags["query_budget"] == 3
+
+    async def run():
+        await init_db()
+        try:
+            instrument_connections()
+            teacher = await User.create(user_id=100, full_name="Teacher", is_teacher=True)
+            class_obj = await Class.create(name="5A", teacher=teacher)
+            students = [
+                await User.create(user_id=200 + number, full_name=f"Student {number}", is_student=True)
+                for number in range(REPEAT_LIMIT + 2)
+            ]
+            await class_obj.students.add(*students)
+
+            bot = Bot(token="42:TEST", session=StubSession())
+            # Any handler over its budget or repeating a statement raises QueryBudgetExceeded
+            updates = (f"attendance_class:{class_obj.id}", f"roll_call:flip:{students[0].id}", "roll_call:all", "roll_call:save")
+            for data in updates:
+                await dispatcher.feed_update(bot, callback_update(teacher.user_id, data))
+            await dispatcher.storage.close()
+            marked = await class_obj.attendances.filter(is_present=True).count()
+            rolled_up = sum(row.present for row in await class_obj.attendance_months.all())
+            return marked, rolled_up, len(students)
+        finally:
+            await close_db()
+
+    marked, rolled_up, enrolled = asyncio.run(run())
+    assert marked == rolled_up == enrolled
@@ -0,0 +1,52 @@
+import asyncio
+
+from test_middlewares import RecordingSession
+
+
+def test_report_pages_are_served_to_their_owner_only(dispatcher):
+    from aiogram import Bot
+
+    from app.models import Class, Grade, Subject, User
+    from app.queries import query_cache
+    from app.reports import NOT_ALLOWED, report_cache
+    from benchmarks.stubs import callback_update, message_update
+    from main import close_db, init_db
+
+    async def run():
+        await init_db()
+        try:
+            teacher = await User.create(user_id=100, full_name="Teacher", is_teacher=True)
+            other_teacher = await User.create(user_id=101, full_name="Other", is_teacher=True)
+            student = await User.create(user_id=200, full_name="Student", is_student=True)
+            other_student = await User.create(user_id=201, full_name="Other student", is_student=True)
+            class_obj = await Class.create(name="5A", teacher=teacher)
+            await class_obj.students.add(student)
+            subject = await Subject.create(title="Math", teacher=teacher)
+            await Grade.create(student=student, subject=subject, value=5)
+
+            session = RecordingSession()
+            bot = Bot(token="42:TEST", session=session)
+            # The student's own results are rendered and cached
+            await dispatcher.feed_update(bot, message_update(student.user_id, "📊 Natijalar"))
+            own = session.texts[-1]
+
+            answers = []
+            for telegram_id, data in (
+                (other_student.user_id, f"report:sresults:{student.id}:0"),
+                (other_teacher.user_id, f"report:results:{class_obj.id}:0"),
+                (other_teacher.user_id, f"class_results_{class_obj.id}"),
+                (teacher.user_id, f"class_results_{class_obj.id}"),
+            ):
+                await dispatcher.feed_update(bot, callback_update(telegram_id, data))
+                answers.append(session.texts[-1])
+            await dispatcher.storage.close()
+            return own, answers
+        finally:
+            query_cache.clear()
+            report_cache.clear()
+            await close_db()
+
+    own, answers = asyncio.run(run())
+    assert "Math" in own
+    assert answers[:3] == [NOT_ALLOWED] * 3
+    assert answers[3].startswith("📊")
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import date
+
+# Tables as the first version of the bot generated them
+OLD_SCHEMA = """
+CREATE TABLE "users" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "user_id" BIGINT NOT NULL UNIQUE,
+    "full_name" VARCHAR(255) NOT NULL,
+    "is_student" INT NOT NULL,
+    "is_teacher" INT NOT NULL,
+    "created_at" TIMESTAMP NOT NULL
+);
+CREATE TABLE "classes" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "name" VARCHAR(100) NOT NULL,
+    "created_at" TIMESTAMP NOT NULL,
+    "teacher_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE
+);
+CREATE TABLE "subjects" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "title" VARCHAR(255) NOT NULL,
+    "created_at" TIMESTAMP NOT NULL,
+    "teacher_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE
+);
+CREATE TABLE "attendances" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "date" TIMESTAMP NOT NULL,
+    "is_present" INT NOT NULL,
+    "class_id_id" INT NOT NULL REFERENCES "classes" ("id") ON DELETE CASCADE,
+    "user_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE,
+    CONSTRAINT "uid_attendances_user_id_8c3e1f" UNIQUE ("user_id", "class_id_id", "date")
+);
+CREATE TABLE "grades" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "value" INT NOT NULL,
+    "created_at" TIMESTAMP NOT NULL,
+    "student_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE,
+    "subject_id" INT NOT NULL REFERENCES "subjects" ("id") ON DELETE CASCADE
+);
+CREATE TABLE "classes_users" (
+    "classes_id" INT NOT NULL REFERENCES "classes" ("id") ON DELETE CASCADE,
+    "user_id" INT NOT NULL REFERENCES "users" ("id") ON DELETE CASCADE
+);
+CREATE UNIQUE INDEX "uidx_classes_use_classes_e21c3f" ON "classes_users" ("classes_id", "user_id");
+INSERT INTO "users" VALUES (1, 100, 'Teacher', 0, 1, '2026-09-01 07:00:00+00:00');
+INSERT INTO "users" VALUES (2, 200, 'Student', 1, 0, '2026-09-01 07:00:00+00:00');
+INSERT INTO "classes" VALUES (1, '5A', '2026-09-01 07:00:00+00:00', 1);
+INSERT INTO "subjects" VALUES (1, 'Math', '2026-09-01 07:00:00+00:00', 1);
+INSERT INTO "classes_users" VALUES (1, 2);
+INSERT INTO "attendances" VALUES (1, '2026-09-01 08:00:00+00:00', 0, 1, 2);
+INSERT INTO "attendances" VALUES (2, '2026-09-01 08:05:00+00:00', 1, 1, 2);
+INSERT INTO "attendances" VALUES (3, '2026-09-02 08:00:00+00:00', 0, 1, 2);
+INSERT INTO "grades" VALUES (1, 4, '2026-09-01 09:00:00+00:00', 2, 1);
+INSERT INTO "grades" VALUES (2, 5, '2026-09-02 09:00:00+00:00', 2, 1);
+"""
+
+
+def test_old_sqlite_database_is_upgraded():
+    from tortoise import Tortoise
+
+    from app.db import get_connection
+    from app.models import Attendance, AttendanceMonthly, GradeStat, User
+    from app.sqlite_schema import prepare_sqlite_schema, table_problems
+    from config import TORTOISE_ORM
+    from main import latest_migration, migration_number
+
+    async def run():
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            await get_connection().execute_script(OLD_SCHEMA)
+            await prepare_sqlite_schema(migration_number(latest_migration()))
+
+            problems = [problem for model in Tortoise.apps["models"].values() for problem in await table_problems(model)]
+            marks = await Attendance.all().order_by("day").values_list("day", "is_present", "marked_at")
+            month = await AttendanceMonthly.get(user_id=2, class_id_id=1)
+            stats = await GradeStat.get(student_id=2, subject_id=1)
+            # Roster imports create students without a Telegram id
+            imported = await User.create(full_name="Imported", is_student=True, invite_code="ABC")
+            return problems, marks, (month.present, month.absent), (stats.grade_count, stats.total), imported.user_id
+        finally:
+            await Tortoise.close_connections()
+
+    problems, marks, month, stats, imported = asyncio.run(run())
+    assert problems == []
+    # The two marks of the first day collapse into the later one
+    assert [(day, is_present) for day, is_present, _ in marks] == [(date(2026, 9, 1), True), (date(2026, 9, 2), False)]
+    assert marks[0][2].minute == 5
+    assert month == (1, 1)
+    assert stats == (2, 9)
+    assert imported is None
+
+
+def test_current_sqlite_schema_is_not_inspected(monkeypatch):
+    from tortoise import Tortoise
+
+    from app import sqlite_schema
+    from config import TORTOISE_ORM
+
+    async def run():
+        await Tortoise.init(config=TORTOISE_ORM)
+        try:
+            await sqlite_schema.prepare_sqlite_schema(7)
+            first = await sqlite_schema.schema_version()
+
+            async def inspected(*args, **kwargs):
+                raise AssertionError("the schema was inspected")
+
+            # A current schema costs one PRAGMA read on boot
+            monkeypatch.setattr(sqlite_schema, "upgrade_tables", inspected)
+            monkeypatch.setattr(sqlite_schema, "table_problems", inspected)
+            monkeypatch.setattr(Tortoise, "generate_schemas", inspected)
+            await sqlite_schema.prepare_sqlite_schema(7)
+            return first
+        finally:
+            await Tortoise.close_connections()
+
+    assert asyncio.run(run()) == 7
@@ -0,0 +1,79 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+
+def _key(chat_id: int) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=chat_id, user_id=chat_id)
+
+
+def test_updates_flush_their_own_writes():
+    from app.db import fetch_all
+    from app.storage import DatabaseStorage
+    from main import close_db, init_db
+
+    async def run():
+        await init_db()
+        try:
+            storage = DatabaseStorage(cache_ttl=0)
+            second_wrote = asyncio.Event()
+            first_flushed = asyncio.Event()
+
+            async def first():
+                token = storage.begin()
+                await storage.set_state(_key(1), "first")
+                await second_wrote.wait()
+                await storage.flush(token)
+                first_flushed.set()
+
+            async def second():
+                token = storage.begin()
+                await storage.set_state(_key(2), "second")
+                second_wrote.set()
+                await first_flushed.wait()
+                saved = [row["state"] for row in await fetch_all("SELECT state FROM fsm_states ORDER BY key")]
+                await storage.flush(token)
+                return saved
+
+            _, saved_before = await asyncio.gather(first(), second())
+            saved_after = [row["state"] for row in await fetch_all("SELECT state FROM fsm_states ORDER BY key")]
+            return saved_before, saved_after
+        finally:
+            await close_db()
+
+    saved_before, saved_after = asyncio.run(run())
+    # The first update to finish doesn't write the other update's pending state
+    assert saved_before == ["first"]
+    assert saved_after == ["first", "second"]
+
+
+def test_flushing_record_stays_readable(monkeypatch):
+    from app import storage as storage_module
+    from app.storage import DatabaseStorage
+    from main import close_db, init_db
+
+    async def run():
+        await init_db()
+        try:
+            storage = DatabaseStorage(cache_ttl=0)
+            await storage.update_data(_key(1), {"marks": [1]})
+            seen = []
+            execute = storage_module.execute
+
+            async def slow_execute(sql, *values, **kwargs):
+                # Another update reads the key while the upsert hasn't committed yet
+                seen.append(await asyncio.create_task(storage.get_data(_key(1))))
+                return await execute(sql, *values, **kwargs)
+
+            monkeypatch.setattr(storage_module, "execute", slow_execute)
+            token = storage.begin()
+            await storage.update_data(_key(1), {"marks": [1, 2]})
+            await storage.flush(token)
+            monkeypatch.setattr(storage_module, "execute", execute)
+            return seen, await storage.get_data(_key(1))
+        finally:
+            await close_db()
+
+    seen, saved = asyncio.run(run())
+    assert seen == [{"marks": [1, 2]}]
+    assert saved == {"marks": [1, 2]}